@@ -3,7 +3,13 @@ from pathlib import Path
 
 import click
 
-from .utils import json_to_csv
+from .utils import iter_csv, json_to_csv
+from .diff import max_partitions, write_diff
+from .clusters import load_clusters
+from .telemetry import get_telemetry_path, session_report, format_report
+from .server import run_server, run_load_test
+from .storage import apply_known_labels
+from .label_cache import LabelCache
 from .ui.cataloger import run_cataloger
 
 
@@ -16,6 +22,39 @@ def cataloger():
     run_cataloger()
 
 
+@ptoolkit.command()
+@click.argument('source_path', type=click.Path(exists=True, path_type=Path))
+@click.argument('target_path', type=click.Path(writable=True, path_type=Path))
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', default=8080)
+@click.option('--batch-size', default=20)
+@click.option('--flush-interval', default=5.0)
+@click.option('--label-cache/--no-label-cache', default=True)
+def serve(source_path, target_path, host, port, batch_size, flush_interval, label_cache):
+    cache = LabelCache() if label_cache else None
+    click.echo(f'serving {source_path} on http://{host}:{port}')
+    run_server(
+        source_path, target_path,
+        host=host, port=port,
+        label_cache=cache,
+        batch_size=batch_size,
+        flush_interval=flush_interval
+    )
+
+@ptoolkit.command('serve-bench')
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', default=8080)
+@click.option('--clients', default=50)
+@click.option('--requests', default=200)
+@click.option('--submit', is_flag=True, help='Label fetched rows, only use on scratch targets')
+def serve_bench(host, port, clients, requests, submit):
+    stats = run_load_test(
+        host=host, port=port, clients=clients, requests=requests, submit=submit)
+    click.echo(
+        f'{stats["requests"]} requests in {stats["elapsed"]:.2f}s: '
+        f'{stats["rps"]:.0f} req/s, p50 {stats["p50_ms"]:.2f}ms, p99 {stats["p99_ms"]:.2f}ms')
+
+
 @ptoolkit.group()
 def data():
     ...
@@ -25,3 +64,54 @@ def data():
 @click.argument('output_path', type=click.Path(writable=True, path_type=Path))
 def es_to_csv(input_path, output_path):
     json_to_csv(input_path, output_path)
+
+@data.command('cache-labels')
+@click.argument('targets', nargs=-1, type=click.Path(exists=True, path_type=Path))
+def cache_labels(targets):
+    with LabelCache() as cache:
+        for target in targets:
+            amount = cache.add_target(target)
+            click.echo(f'{target}: cached {amount} labels')
+
+        click.echo(f'{len(cache)} known prompts')
+
+@data.command('apply-known-labels')
+@click.argument('source_path', type=click.Path(exists=True, path_type=Path))
+@click.argument('target_path', type=click.Path(writable=True, path_type=Path))
+def apply_known_labels_cmd(source_path, target_path):
+    with LabelCache() as cache:
+        amount = apply_known_labels(source_path, target_path, cache)
+
+    click.echo(f'pre-labeled {amount} known prompts')
+
+@data.command('clusters')
+@click.argument('source_path', type=click.Path(exists=True, path_type=Path))
+def clusters_cmd(source_path):
+    clusters = load_clusters(
+        source_path, [row['Prompt'] for row in iter_csv(source_path)])
+
+    grouped = [cluster for cluster in clusters if len(cluster) > 1]
+    click.echo(
+        f'{len(clusters)} clusters, {len(grouped)} with more than one prompt '
+        f'covering {sum(len(cluster) for cluster in grouped)} prompts')
+
+@data.command('diff')
+@click.argument('old_path', type=click.Path(exists=True, path_type=Path))
+@click.argument('new_paths', nargs=-1, required=True, type=click.Path(exists=True, path_type=Path))
+@click.option('--key', type=click.Choice(['prompt', 'id']), default='prompt')
+@click.option('--output', '-o', type=click.Path(writable=True, path_type=Path), default=None)
+@click.option('--partitions', default=64, type=click.IntRange(1, max_partitions), help='Raise for inputs much larger than RAM')
+def diff(old_path, new_paths, key, output, partitions):
+    counts = write_diff(
+        [old_path], list(new_paths), target=output, key=key, partitions=partitions)
+    click.echo(
+        ', '.join(f'{change}: {amount}' for change, amount in counts.items()), err=True)
+
+@data.command('session-report')
+@click.argument('log_paths', nargs=-1, type=click.Path(exists=True, path_type=Path))
+@click.option('--slowest', default=10)
+def session_report_cmd(log_paths, slowest):
+    if not log_paths:
+        log_paths = sorted(get_telemetry_path().glob('*.jsonl'))
+
+    click.echo(format_report(session_report(log_paths, slowest=slowest)))
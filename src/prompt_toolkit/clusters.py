@@ -0,0 +1,131 @@
+import json
+import hashlib
+
+from pathlib import Path
+
+from .utils import get_home_path, open_dataset
+from .label_cache import normalize_prompt
+
+
+_minhash_bands = 8
+_minhash_rows = 3
+_minhash_prime = (1 << 61) - 1
+_minhash_params = [
+    (
+        int.from_bytes(hashlib.blake2b(f'a{i}'.encode(), digest_size=8).digest(), 'little') | 1,
+        int.from_bytes(hashlib.blake2b(f'b{i}'.encode(), digest_size=8).digest(), 'little')
+    )
+    for i in range(_minhash_bands * _minhash_rows)
+]
+
+
+def _minhash(tokens: frozenset[str], token_cache: dict[str, tuple[int, ...]]) -> tuple[int, ...]:
+    values = []
+    for token in tokens:
+        perms = token_cache.get(token)
+        if perms is None:
+            h = int.from_bytes(
+                hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+            perms = tuple((a * h + b) % _minhash_prime for a, b in _minhash_params)
+            token_cache[token] = perms
+
+        values.append(perms)
+
+    return tuple(map(min, zip(*values)))
+
+
+def _jaccard(a: frozenset[str], b: frozenset[str]) -> float:
+    union = len(a | b)
+    return len(a & b) / union if union else 1.0
+
+
+def cluster_prompts(
+    prompts: list[str],
+    prefix_tokens: int = 3,
+    threshold: float = 0.5,
+    leaders: int = 8
+) -> list[list[int]]:
+    '''Group prompt indexes into template families.
+
+    Prompts sharing their first `prefix_tokens` normalized tokens are
+    greedily assigned to the first cluster whose representative has a
+    token set jaccard similarity >= threshold. Candidate representatives
+    come from MinHash LSH buckets (8 bands of 3 rows, ~0.5 jaccard) scoped
+    to the prefix, each holding at most `leaders` representatives, so the
+    work is O(n) instead of comparing against every cluster in the prefix.
+    Returns clusters as lists of indexes, biggest first, representative
+    first inside each cluster.
+    '''
+    tokens: list[frozenset[str]] = []
+    buckets: dict[tuple, list[int]] = {}
+    token_cache: dict[str, tuple[int, ...]] = {}
+    clusters: dict[int, list[int]] = {}
+    for i, prompt in enumerate(prompts):
+        words = normalize_prompt(prompt).split()
+        tokens.append(frozenset(words))
+
+        prefix = tuple(words[:prefix_tokens])
+        keys = [(prefix,)]
+        if words:
+            signature = _minhash(tokens[i], token_cache)
+            keys += [
+                (prefix, band, *signature[band * _minhash_rows:(band + 1) * _minhash_rows])
+                for band in range(_minhash_bands)
+            ]
+
+        representative = next(
+            (
+                j
+                for key in keys
+                for j in buckets.get(key, ())
+                if _jaccard(tokens[i], tokens[j]) >= threshold
+            ),
+            None
+        )
+        if representative is not None:
+            clusters[representative].append(i)
+            continue
+
+        clusters[i] = [i]
+        for key in keys:
+            bucket = buckets.setdefault(key, [])
+            if len(bucket) < leaders:
+                bucket.append(i)
+
+    return sorted(clusters.values(), key=len, reverse=True)
+
+
+def _cache_path(source: Path, prefix_tokens: int, threshold: float) -> Path:
+    stat = source.stat()
+    key = f'{source.resolve()}:{stat.st_size}:{stat.st_mtime_ns}:{prefix_tokens}:{threshold}'
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+    cache_dir = get_home_path() / 'clusters'
+    cache_dir.mkdir(exist_ok=True)
+    return cache_dir / f'{digest}.json.gz'
+
+
+def load_clusters(
+    source: Path,
+    prompts: list[str],
+    prefix_tokens: int = 3,
+    threshold: float = 0.5
+) -> list[list[int]]:
+    '''Clusters for a source dataset, computed once and cached under the
+    home dir keyed by source path, size, mtime and clustering params.
+    '''
+    path = _cache_path(Path(source), prefix_tokens, threshold)
+    try:
+        with open_dataset(path, 'r') as file:
+            return json.load(file)
+
+    except (OSError, EOFError, json.decoder.JSONDecodeError):
+        pass
+
+    clusters = cluster_prompts(
+        prompts, prefix_tokens=prefix_tokens, threshold=threshold)
+
+    with open_dataset(path, 'w') as file:
+        json.dump(clusters, file)
+
+    return clusters
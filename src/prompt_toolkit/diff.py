@@ -0,0 +1,156 @@
+import sys
+import csv
+import hashlib
+import tempfile
+
+from typing import Iterator
+from pathlib import Path
+
+from .utils import IO_BUFFER_SIZE, iter_csv, open_dataset
+from .label_cache import prompt_hash, is_labeled
+
+
+diff_header = ['Change', 'ID', 'Prompt', 'NSFW', 'MI', 'Old NSFW', 'Old MI']
+
+# every partition file of one side is open at once, stay well under the
+# usual 1024 open files limit
+max_partitions = 256
+
+
+def _row_key(row: dict[str, str], key: str) -> bytes:
+    match key:
+        case 'prompt':
+            return prompt_hash(row['Prompt'])
+
+        case 'id':
+            return hashlib.blake2b(
+                row['ID'].encode('utf-8'), digest_size=16).digest()
+
+        case _:
+            raise ValueError(f'Can\'t diff by key {key}')
+
+
+def _labels(nsfw_val: str, mi_val: str) -> tuple[float, int]|None:
+    # None for sources and unlabeled target rows, only labels get compared
+    try:
+        labels = float(nsfw_val), int(mi_val)
+
+    except ValueError:
+        return None
+
+    if not is_labeled(*labels):
+        return None
+
+    # untouched MI counts as 0, same as the label cache
+    return labels[0], max(labels[1], 0)
+
+
+def _partition(
+    sources: list[Path],
+    key: str,
+    tmp_dir: Path,
+    prefix: str,
+    partitions: int
+) -> None:
+    files = [
+        open(tmp_dir / f'{prefix}{p}.csv', 'w', newline='', encoding='utf-8',
+             buffering=IO_BUFFER_SIZE // partitions)
+        for p in range(partitions)
+    ]
+    writers = [csv.writer(file) for file in files]
+    try:
+        for source in sources:
+            for row in iter_csv(source):
+                h = _row_key(row, key)
+                writers[int.from_bytes(h[:4], 'little') % partitions].writerow((
+                    h.hex(), row['ID'], row['Prompt'],
+                    row.get('NSFW', ''), row.get('MI', '')
+                ))
+
+    finally:
+        for file in files:
+            file.close()
+
+
+def _read_partition(path: Path) -> Iterator[list[str]]:
+    with open(path, 'r', newline='', encoding='utf-8') as file:
+        yield from csv.reader(file)
+
+
+def diff_datasets(
+    old: list[Path],
+    new: list[Path],
+    key: str = 'prompt',
+    partitions: int = 64
+) -> Iterator[tuple]:
+    '''Yield (change, id, prompt, nsfw, mi, old nsfw, old mi) rows for
+    prompts added, removed or relabeled between the old and new datasets,
+    rows unlabeled on either side never count as relabeled.
+
+    Inputs are streamed and hash partitioned by key into temp files, then
+    each old partition is loaded into a dict and joined against the
+    matching new partition, so memory use is bounded by one partition
+    instead of the whole dataset. Rows come out in partition order.
+    '''
+    if not (1 <= partitions <= max_partitions):
+        raise ValueError(f'partitions must be between 1 and {max_partitions}')
+
+    with tempfile.TemporaryDirectory(prefix='ptoolkit-diff-') as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        _partition(old, key, tmp_dir, 'old', partitions)
+        _partition(new, key, tmp_dir, 'new', partitions)
+
+        for p in range(partitions):
+            old_rows = {
+                row[0]: row
+                for row in _read_partition(tmp_dir / f'old{p}.csv')
+            }
+
+            seen = set()
+            for h, _id, prompt, nsfw_val, mi_val in _read_partition(tmp_dir / f'new{p}.csv'):
+                if h in seen:
+                    continue
+
+                seen.add(h)
+                old_row = old_rows.get(h)
+                if not old_row:
+                    yield ('added', _id, prompt, nsfw_val, mi_val, '', '')
+                    continue
+
+                _, _, _, old_nsfw, old_mi = old_row
+                new_labels = _labels(nsfw_val, mi_val)
+                old_labels = _labels(old_nsfw, old_mi)
+                if new_labels and old_labels and new_labels != old_labels:
+                    yield ('relabeled', _id, prompt, nsfw_val, mi_val, old_nsfw, old_mi)
+
+            for h, (_, _id, prompt, nsfw_val, mi_val) in old_rows.items():
+                if h not in seen:
+                    yield ('removed', _id, prompt, '', '', nsfw_val, mi_val)
+
+
+def write_diff(
+    old: list[Path],
+    new: list[Path],
+    target: Path|None = None,
+    **kwargs
+) -> dict[str, int]:
+    '''Write the diff as csv to target (stdout if None), returns the amount
+    of rows per change type.
+    '''
+    counts = {'added': 0, 'removed': 0, 'relabeled': 0}
+
+    def _write(file) -> None:
+        writer = csv.writer(file)
+        writer.writerow(diff_header)
+        for row in diff_datasets(old, new, **kwargs):
+            counts[row[0]] += 1
+            writer.writerow(row)
+
+    if target:
+        with open_dataset(target, 'w', newline='') as file:
+            _write(file)
+
+    else:
+        _write(sys.stdout)
+
+    return counts
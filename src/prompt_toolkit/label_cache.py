@@ -0,0 +1,171 @@
+import sqlite3
+import hashlib
+
+from typing import Iterable
+from pathlib import Path
+
+from .utils import get_home_path, csv_to_list
+
+
+def normalize_prompt(prompt: str) -> str:
+    return ' '.join(prompt.lower().split())
+
+
+def prompt_hash(prompt: str) -> bytes:
+    return hashlib.blake2b(
+        normalize_prompt(prompt).encode('utf-8'), digest_size=16).digest()
+
+
+def is_labeled(nsfw_val: float, mi_val: int) -> bool:
+    # the NSFW factor is the label every prompt gets, the MI checkbox is
+    # only clicked when it applies so an untouched MI (-1) counts as 0
+    return nsfw_val >= 0
+
+
+class BloomFilter:
+    '''Fixed size bloom filter over prompt hashes, bit positions are derived
+    from the hash itself by double hashing so no re-hashing is needed.
+    '''
+
+    def __init__(self, bits: int = 1 << 24, hashes: int = 7, data: bytes|None = None):
+        self.bits = bits
+        self.hashes = hashes
+        self._data = bytearray(data) if data else bytearray(bits // 8)
+
+    @staticmethod
+    def capacity_for(bits: int) -> int:
+        # ~1% false positive rate with 7 hashes
+        return bits // 10
+
+    @property
+    def capacity(self) -> int:
+        return BloomFilter.capacity_for(self.bits)
+
+    def _positions(self, h: bytes) -> Iterable[int]:
+        h1 = int.from_bytes(h[:8], 'little')
+        h2 = int.from_bytes(h[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.bits
+
+    def add(self, h: bytes) -> None:
+        for pos in self._positions(h):
+            self._data[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, h: bytes) -> bool:
+        return all(
+            self._data[pos >> 3] & (1 << (pos & 7))
+            for pos in self._positions(h)
+        )
+
+    def to_bytes(self) -> bytes:
+        return bytes(self._data)
+
+
+class LabelCache:
+    '''Persistent map of normalized prompt hash -> (nsfw, mi) labels.
+
+    Labels live in a sqlite table keyed by hash, a bloom filter kept next to
+    it answers most lookups for never seen prompts without touching the db.
+    '''
+
+    def __init__(self, path: Path|None = None):
+        self.path = Path(path) if path else get_home_path() / 'label_cache.db'
+        self._db = sqlite3.connect(self.path)
+        self._db.executescript(
+            'CREATE TABLE IF NOT EXISTS labels ('
+            '    hash BLOB PRIMARY KEY, nsfw REAL NOT NULL, mi INTEGER NOT NULL'
+            ') WITHOUT ROWID;'
+            'CREATE TABLE IF NOT EXISTS meta ('
+            '    key TEXT PRIMARY KEY, value BLOB'
+            ');'
+        )
+        self._bloom = self._load_bloom()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._db.execute('SELECT COUNT(*) FROM labels').fetchone()[0]
+
+    def _load_bloom(self) -> BloomFilter:
+        row = self._db.execute(
+            'SELECT value FROM meta WHERE key = \'bloom\'').fetchone()
+        count = len(self)
+
+        if row:
+            bloom = BloomFilter(bits=len(row[0]) * 8, data=row[0])
+            if count <= bloom.capacity:
+                return bloom
+
+        return self._rebuild_bloom(count)
+
+    def _rebuild_bloom(self, count: int) -> BloomFilter:
+        bits = 1 << 24
+        while BloomFilter.capacity_for(bits) < count:
+            bits <<= 1
+
+        bloom = BloomFilter(bits=bits)
+        for (h,) in self._db.execute('SELECT hash FROM labels'):
+            bloom.add(h)
+
+        return bloom
+
+    def _store_bloom(self) -> None:
+        self._db.execute(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (\'bloom\', ?)',
+            (self._bloom.to_bytes(),))
+
+    def add(self, rows: Iterable[tuple[str, float, int]]) -> int:
+        '''Store labels for (prompt, nsfw, mi) rows, unlabeled rows are
+        ignored and newer labels replace older ones. Returns amount stored.
+        '''
+        batch = []
+        for prompt, nsfw_val, mi_val in rows:
+            nsfw_val, mi_val = float(nsfw_val), int(mi_val)
+            if not is_labeled(nsfw_val, mi_val):
+                continue
+
+            mi_val = max(mi_val, 0)
+
+            h = prompt_hash(prompt)
+            self._bloom.add(h)
+            batch.append((h, nsfw_val, mi_val))
+
+        with self._db:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO labels (hash, nsfw, mi) VALUES (?, ?, ?)',
+                batch)
+
+            count = len(self)
+            if count > self._bloom.capacity:
+                self._bloom = self._rebuild_bloom(count)
+
+            self._store_bloom()
+
+        return len(batch)
+
+    def add_target(self, target: Path) -> int:
+        return self.add(
+            (prompt, nsfw_val, mi_val)
+            for _id, prompt, nsfw_val, mi_val in csv_to_list(target)
+        )
+
+    def lookup(self, prompts: Iterable[str]) -> list[tuple[float, int]|None]:
+        results = []
+        for prompt in prompts:
+            h = prompt_hash(prompt)
+            if h not in self._bloom:
+                results.append(None)
+                continue
+
+            row = self._db.execute(
+                'SELECT nsfw, mi FROM labels WHERE hash = ?', (h,)).fetchone()
+            results.append(tuple(row) if row else None)
+
+        return results
+
+    def close(self) -> None:
+        self._db.close()
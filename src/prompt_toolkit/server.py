@@ -0,0 +1,519 @@
+import json
+import time
+import asyncio
+import logging
+
+from contextlib import suppress
+from urllib.parse import urlsplit, parse_qs
+
+from .storage import PromptStorage
+from .label_cache import is_labeled
+
+
+_status_texts = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large'
+}
+
+_max_body_size = 4 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class AnnotationServer:
+    '''Serves the PromptStorage labeling workflow over HTTP/JSON.
+
+    The dataset lives in memory, pending rows are leased in batches to
+    annotators so no two get the same prompt, and labels submitted in
+    between flushes get persisted to the target in a single write.
+    '''
+
+    def __init__(
+        self,
+        storage: PromptStorage,
+        batch_size: int = 20,
+        lease_time: float = 600,
+        flush_interval: float = 5
+    ):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.lease_time = lease_time
+        self.flush_interval = flush_interval
+
+        # row index -> (annotator, lease expiry)
+        self._leases: dict[int, tuple[str, float]] = {}
+        self._released: list[int] = []
+        self._cursor = 0
+        self._dirty = False
+        # target write in flight on a worker thread
+        self._writing: asyncio.Future|None = None
+
+        self._labeled = sum(
+            1 for values in storage._target if is_labeled(*values))
+        self._annotators: dict[str, int] = {}
+
+    # dataset workflow
+
+    def _reclaim_leases(self) -> None:
+        now = time.monotonic()
+        expired = [i for i, (_, expiry) in self._leases.items() if expiry < now]
+        for i in expired:
+            del self._leases[i]
+
+        self._released.extend(expired)
+
+    def _is_pending(self, index: int) -> bool:
+        return (
+            index not in self._leases
+            and not is_labeled(*self.storage._target[index])
+        )
+
+    def next_batch(self, annotator: str, size: int) -> list[dict]:
+        self._reclaim_leases()
+        size = min(max(size, 1), self.batch_size * 10)
+
+        rows = []
+        while self._released and len(rows) < size:
+            i = self._released.pop()
+            if self._is_pending(i):
+                rows.append(i)
+
+        total = len(self.storage)
+        while self._cursor < total and len(rows) < size:
+            if self._is_pending(self._cursor):
+                rows.append(self._cursor)
+
+            self._cursor += 1
+
+        expiry = time.monotonic() + self.lease_time
+        batch = []
+        for i in rows:
+            self._leases[i] = (annotator, expiry)
+            _id, prompt, nsfw_val, mi_val = self.storage.get_row(i)
+            batch.append({'index': i, 'id': _id, 'prompt': prompt})
+
+        return batch
+
+    def submit_labels(self, annotator: str, labels: list[dict]) -> int:
+        # validate whole batch before touching storage
+        if not isinstance(labels, list):
+            raise HTTPError(400, 'labels must be a list')
+
+        parsed = []
+        for label in labels:
+            try:
+                index = int(label['index'])
+                nsfw_val = float(label['nsfw'])
+                mi_val = int(label['mi'])
+
+            except (KeyError, TypeError, ValueError):
+                raise HTTPError(400, f'Malformed label {label}')
+
+            if not (0 <= index < len(self.storage)):
+                raise HTTPError(400, f'Row index {index} out of range')
+
+            if not (0 <= nsfw_val <= 1 and mi_val in (0, 1)):
+                raise HTTPError(400, f'Invalid label values for row {index}')
+
+            parsed.append((index, nsfw_val, mi_val))
+
+        for index, nsfw_val, mi_val in parsed:
+            if not is_labeled(*self.storage._target[index]):
+                self._labeled += 1
+
+            self.storage.set_row_values(index, (nsfw_val, mi_val))
+            self._leases.pop(index, None)
+
+        if parsed:
+            self._dirty = True
+            self._annotators[annotator] = self._annotators.get(annotator, 0) + len(parsed)
+
+        return len(parsed)
+
+    def release(self, annotator: str, indexes: list[int]) -> int:
+        if not (
+            isinstance(indexes, list)
+            and all(type(i) is int for i in indexes)
+        ):
+            raise HTTPError(400, 'indexes must be a list of row indexes')
+
+        released = 0
+        for i in indexes:
+            lease = self._leases.get(i)
+            if lease and lease[0] == annotator:
+                del self._leases[i]
+                self._released.append(i)
+                released += 1
+
+        return released
+
+    def progress(self) -> dict:
+        return {
+            'total': len(self.storage),
+            'labeled': self._labeled,
+            'leased': len(self._leases),
+            'annotators': self._annotators
+        }
+
+    # persistence
+
+    async def flush(self) -> None:
+        # cancelling a flush does not stop its thread, never start a second
+        # write to the same tmp file while one is still running
+        if self._writing is not None:
+            await asyncio.wait([self._writing])
+
+        if not self._dirty:
+            return
+
+        # snapshot rows on the loop, write them on a worker thread
+        self._dirty = False
+        rows = self.storage.target_rows()
+        resume = self.storage.first_unlabeled()
+        self._writing = asyncio.ensure_future(
+            asyncio.to_thread(self.storage.write_target, rows, resume))
+        try:
+            await asyncio.shield(self._writing)
+
+        except BaseException:
+            # labels are still only in memory, retry on next flush
+            self._dirty = True
+            raise
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+
+            except Exception:
+                logger.exception(
+                    'Failed to write target %s, retrying in %ss',
+                    self.storage.target, self.flush_interval)
+
+    # http layer
+
+    def _route(self, method: str, path: str, query: dict, body: bytes) -> tuple[str, bytes]:
+        annotator = query.get('annotator', ['anonymous'])[0]
+
+        if path == '/':
+            if method != 'GET':
+                raise HTTPError(405, f'{method} not allowed on {path}')
+
+            return 'text/html; charset=utf-8', _index_html.encode('utf-8')
+
+        if method == 'GET':
+            match path:
+                case '/api/batch':
+                    size = int(query.get('size', [self.batch_size])[0])
+                    result = {'rows': self.next_batch(annotator, size)}
+
+                case '/api/progress':
+                    result = self.progress()
+
+                case _:
+                    raise HTTPError(404, f'No route {path}')
+
+        elif method == 'POST':
+            try:
+                payload = json.loads(body or b'{}')
+
+            except json.decoder.JSONDecodeError:
+                raise HTTPError(400, 'Body is not valid json')
+
+            if not isinstance(payload, dict):
+                raise HTTPError(400, 'Body must be a json object')
+
+            match path:
+                case '/api/labels':
+                    result = {'stored': self.submit_labels(annotator, payload.get('labels', []))}
+
+                case '/api/release':
+                    result = {'released': self.release(annotator, payload.get('indexes', []))}
+
+                case _:
+                    raise HTTPError(404, f'No route {path}')
+
+        else:
+            raise HTTPError(405, f'{method} not allowed on {path}')
+
+        return 'application/json', json.dumps(result).encode('utf-8')
+
+    async def _handle_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            # keep-alive loop, one request at a time per connection
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                method, target, version = request_line.decode('latin-1').split()
+
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+
+                keep_alive = (
+                    headers.get('connection', '').lower() != 'close'
+                    and version == 'HTTP/1.1'
+                )
+
+                try:
+                    length = int(headers.get('content-length', 0))
+                    if length > _max_body_size:
+                        raise HTTPError(413, 'Request body too large')
+
+                    body = await reader.readexactly(length) if length else b''
+
+                    url = urlsplit(target)
+                    status = 200
+                    content_type, payload = self._route(
+                        method, url.path, parse_qs(url.query), body)
+
+                except HTTPError as e:
+                    status = e.status
+                    content_type = 'application/json'
+                    payload = json.dumps({'error': str(e)}).encode('utf-8')
+                    keep_alive = keep_alive and status != 413
+
+                except (TypeError, ValueError) as e:
+                    status = 400
+                    content_type = 'application/json'
+                    payload = json.dumps({'error': str(e)}).encode('utf-8')
+
+                writer.write(
+                    f'HTTP/1.1 {status} {_status_texts[status]}\r\n'
+                    f'Content-Type: {content_type}\r\n'
+                    f'Content-Length: {len(payload)}\r\n'
+                    f'Connection: {"keep-alive" if keep_alive else "close"}\r\n'
+                    '\r\n'.encode('latin-1') + payload
+                )
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+
+        except (ValueError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8080) -> None:
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        flusher = asyncio.create_task(self._flush_loop())
+        try:
+            async with server:
+                await server.serve_forever()
+
+        finally:
+            flusher.cancel()
+            with suppress(asyncio.CancelledError):
+                await flusher
+
+            await self.flush()
+
+
+def run_server(
+    source: str,
+    target: str,
+    host: str = '127.0.0.1',
+    port: int = 8080,
+    label_cache=None,
+    **kwargs
+) -> None:
+    storage = PromptStorage(source, target, label_cache=label_cache)
+    if label_cache is not None:
+        label_cache.close()
+
+    server = AnnotationServer(storage, **kwargs)
+    try:
+        asyncio.run(server.serve(host=host, port=port))
+
+    except KeyboardInterrupt:
+        pass
+
+
+# load testing client
+
+async def _bench_client(
+    host: str,
+    port: int,
+    annotator: str,
+    requests: int,
+    submit: bool,
+    latencies: list[float]
+) -> None:
+    reader, writer = await asyncio.open_connection(host, port)
+
+    async def request(method: str, path: str, body: dict|None = None) -> dict:
+        payload = json.dumps(body).encode('utf-8') if body is not None else b''
+        start = time.perf_counter()
+        writer.write(
+            f'{method} {path} HTTP/1.1\r\n'
+            f'Host: {host}\r\n'
+            f'Content-Length: {len(payload)}\r\n'
+            '\r\n'.encode('latin-1') + payload
+        )
+        await writer.drain()
+
+        await reader.readline()
+        length = 0
+        while (line := await reader.readline()) not in (b'\r\n', b''):
+            key, _, value = line.decode('latin-1').partition(':')
+            if key.lower() == 'content-length':
+                length = int(value)
+
+        result = json.loads(await reader.readexactly(length))
+        latencies.append(time.perf_counter() - start)
+        return result
+
+    try:
+        for _ in range(requests // 2):
+            batch = await request('GET', f'/api/batch?annotator={annotator}')
+            indexes = [row['index'] for row in batch['rows']]
+            if submit:
+                await request('POST', f'/api/labels?annotator={annotator}', {
+                    'labels': [{'index': i, 'nsfw': 0, 'mi': 0} for i in indexes]
+                })
+
+            else:
+                await request(
+                    'POST', f'/api/release?annotator={annotator}', {'indexes': indexes})
+
+    finally:
+        writer.close()
+
+
+def run_load_test(
+    host: str = '127.0.0.1',
+    port: int = 8080,
+    clients: int = 50,
+    requests: int = 200,
+    submit: bool = False
+) -> dict:
+    '''Hammer a running server with concurrent keep-alive clients, each one
+    fetching batches and releasing (or with submit, labeling) them.
+    '''
+    latencies: list[float] = []
+
+    async def _run() -> float:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            _bench_client(host, port, f'bench{c}', requests, submit, latencies)
+            for c in range(clients)
+        ))
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(_run())
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+
+    return {
+        'requests': len(latencies),
+        'elapsed': elapsed,
+        'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(0.50),
+        'p99_ms': percentile(0.99)
+    }
+
+
+_index_html = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Prompt Cataloger 3000 - ACME</title>
+<style>
+  body { background: #141414; color: #e5e5e5; font-family: Arial, sans-serif; max-width: 900px; margin: 2em auto; }
+  #prompt { font-size: 24px; text-align: center; min-height: 6em; padding: 1em; background: #070707; }
+  button { font-size: 18px; padding: 0.4em 1em; }
+  .row { display: flex; align-items: center; gap: 1em; margin: 1em 0; }
+  #nsfw { flex-grow: 1; }
+  .good { background: #386b2a; color: #e5e5e5; }
+  .bad { background: #c44c4a; color: #e5e5e5; }
+</style>
+</head>
+<body>
+<div class="row">
+  <label>Annotator: <input id="annotator"></label>
+  <span id="progress"></span>
+</div>
+<div id="prompt">Loading...</div>
+<div class="row">
+  <label for="nsfw">NSFW: <span id="nsfw_value">0</span></label>
+  <input id="nsfw" type="range" min="0" max="100" value="0">
+</div>
+<div class="row">
+  <button class="good" onclick="label(0)">Minor Involvment: no</button>
+  <button class="bad" onclick="label(1)">Minor Involvment: yes</button>
+</div>
+<script>
+const annotatorInput = document.getElementById('annotator');
+annotatorInput.value = localStorage.getItem('annotator') || 'anonymous';
+annotatorInput.onchange = () => localStorage.setItem('annotator', annotatorInput.value);
+
+const nsfw = document.getElementById('nsfw');
+nsfw.oninput = () => document.getElementById('nsfw_value').textContent = nsfw.value;
+
+let queue = [];
+let pending = [];
+
+function query() {
+  return '?annotator=' + encodeURIComponent(annotatorInput.value);
+}
+
+async function flush() {
+  if (!pending.length) return;
+  const labels = pending;
+  pending = [];
+  await fetch('/api/labels' + query(), {method: 'POST', body: JSON.stringify({labels})});
+}
+
+async function refill() {
+  await flush();
+  const res = await fetch('/api/batch' + query());
+  queue = (await res.json()).rows;
+  const progress = await (await fetch('/api/progress')).json();
+  document.getElementById('progress').textContent = progress.labeled + '/' + progress.total;
+}
+
+async function show() {
+  if (!queue.length) await refill();
+  document.getElementById('prompt').textContent = queue.length ? queue[0].prompt : 'All done!';
+  nsfw.value = 0;
+  nsfw.oninput();
+}
+
+async function label(mi) {
+  if (!queue.length) return;
+  const row = queue.shift();
+  pending.push({index: row.index, nsfw: nsfw.value / 100, mi});
+  await show();
+}
+
+window.addEventListener('beforeunload', () => {
+  if (pending.length)
+    navigator.sendBeacon('/api/labels' + query(), JSON.stringify({labels: pending}));
+});
+show();
+</script>
+</body>
+</html>
+'''
@@ -0,0 +1,346 @@
+import os
+import struct
+import hashlib
+
+from pathlib import Path
+
+from .utils import csv_to_list, list_to_csv, temp_path_for
+from .telemetry import Telemetry
+from .label_cache import LabelCache, normalize_prompt, is_labeled
+
+
+_index_magic = b'PTKIDX2\n'
+_hash_size = 8
+
+
+def row_hash(prompt: str) -> bytes:
+    return hashlib.blake2b(
+        normalize_prompt(prompt).encode('utf-8'), digest_size=_hash_size).digest()
+
+
+def index_path_for(target: Path) -> Path:
+    target = Path(target)
+    return target.with_name(target.name + '.idx')
+
+
+def target_index(rows: list[tuple]) -> tuple[list[str], bytes]:
+    '''ID -> (row, prompt hash) index of target rows, derived from the
+    target's own ID and Prompt columns so it can never go stale.
+    '''
+    return (
+        [_id for _id, *_ in rows],
+        b''.join(row_hash(prompt) for _id, prompt, *_ in rows)
+    )
+
+
+def _index_digest(ids: list[str], hashes: bytes) -> bytes:
+    digest = hashlib.blake2b(hashes, digest_size=16)
+    digest.update('\n'.join(ids).encode('utf-8'))
+    return digest.digest()
+
+
+def write_target_index(target: Path, ids: list[str], hashes: bytes, resume: int) -> None:
+    '''Store a checksum of the target's ID/prompt index and the row to
+    resume labeling at next to it.
+
+    Layout: magic, row count, resume row and a 16 byte digest of the IDs
+    and prompt hashes.
+    '''
+    path = index_path_for(target)
+    tmp = temp_path_for(path)
+    with open(tmp, 'wb') as file:
+        file.write(_index_magic)
+        file.write(struct.pack('<QQ', len(ids), resume))
+        file.write(_index_digest(ids, hashes))
+
+    os.replace(tmp, path)
+
+
+def read_target_resume(target: Path, ids: list[str], hashes: bytes) -> int|None:
+    '''Resume row stored next to target, None when there is no sidecar or
+    it does not match the target on disk (e.g. rewritten by another tool).
+    '''
+    try:
+        with open(index_path_for(target), 'rb') as file:
+            if file.read(len(_index_magic)) != _index_magic:
+                return None
+
+            count, resume = struct.unpack('<QQ', file.read(16))
+            digest = file.read(16)
+
+    except (OSError, struct.error):
+        return None
+
+    if count != len(ids) or digest != _index_digest(ids, hashes):
+        return None
+
+    return resume
+
+
+def write_target_file(
+    target: Path,
+    rows: list[tuple[str, str, float, int]],
+    resume: int
+) -> None:
+    '''Write target rows and their sidecar index, every target writer goes
+    through here so both stay in sync. `resume` is the row labeling should
+    continue at, unrelated to how many rows get written.
+    '''
+    list_to_csv(target, rows)
+    write_target_index(target, *target_index(rows), resume=resume)
+
+
+def apply_known_labels(source: Path, target: Path, cache: LabelCache) -> int:
+    '''Write a target for source with every prompt known to the cache
+    pre-labeled and the rest left as -1, labeling resumes at its first row.
+    Returns amount of known prompts.
+    '''
+    rows = csv_to_list(source)
+    known = cache.lookup(prompt for _id, ts, prompt, *_ in rows)
+
+    final = []
+    for (_id, ts, prompt, *_), labels in zip(rows, known):
+        final.append((_id, prompt, *(labels if labels else (-1, -1))))
+
+    write_target_file(target, final, resume=0)
+    return sum(1 for labels in known if labels)
+
+
+class PromptStorage:
+
+    def __init__(
+        self,
+        source: str,
+        target: str,
+        label_cache: LabelCache|None = None,
+        skip_known: bool = True,
+        telemetry: Telemetry|None = None
+    ):
+        self.source = Path(source)
+        self.target = Path(target)
+        self.skip_known = skip_known
+        self.telemetry = telemetry
+
+        self._source = csv_to_list(source)
+        self._source_hashes = b''.join(row_hash(row[2]) for row in self._source)
+        self._target = []
+
+        # (target row, ID, 'remapped' | 'orphaned') for labels that did not
+        # match their source row
+        self.misaligned: list[tuple[int, str, str]] = []
+
+        self._resume: int|None = None
+        if self.target.is_file():
+            self._load_target()
+
+        # highest row carrying any value, rows up to it get persisted on save
+        self._saved_index = max(len(self._target) - 1, 0)
+
+        # resume at stored position, else right after the last saved row
+        self._current_index = len(self._target)
+        if self._resume is not None:
+            self._current_index = min(self._resume, len(self._target))
+
+        for i in range(len(self._target), len(self._source)):
+            self._target.append([-1, -1])
+
+        # rows ahead of the resume point that already carry labels
+        self._known: set[int] = {
+            i for i in range(self._current_index, len(self._target))
+            if is_labeled(*self._target[i])
+        }
+
+        if label_cache is not None:
+            self._apply_label_cache(label_cache)
+
+        self._current_index = min(
+            self._skip_known_from(self._current_index), len(self._source) - 1)
+
+    def _load_target(self) -> None:
+        rows = csv_to_list(self.target)
+        labels = [
+            [float(nsfw_val), int(mi_val)]
+            for _id, prompt, nsfw_val, mi_val in rows
+        ]
+
+        ids, hashes = target_index(rows)
+        size = len(hashes)
+
+        # fast path, every row hash matches its source row in one compare
+        if size <= len(self._source_hashes) and self._source_hashes[:size] == hashes:
+            self._target = labels
+            self._resume = read_target_resume(self.target, ids, hashes)
+            return
+
+        source_ids = {row[0]: i for i, row in enumerate(self._source)}
+        source_by_hash: dict[bytes, int] = {}
+        for i in range(len(self._source)):
+            source_by_hash.setdefault(self._source_row_hash(i), i)
+
+        self._target = [[-1, -1] for _ in range(len(self._source))]
+        placed: set[int] = set()
+        orphans = []
+        for i, (_id, values) in enumerate(zip(ids, labels)):
+            h = hashes[i * _hash_size:(i + 1) * _hash_size]
+
+            if i < len(self._source) and self._source_row_hash(i) == h:
+                j = i
+
+            else:
+                j = source_ids.get(_id)
+                if j is None or self._source_row_hash(j) != h:
+                    j = source_by_hash.get(h)
+
+            if j is None or j in placed:
+                if values != [-1, -1]:
+                    self.misaligned.append((i, _id, 'orphaned'))
+                    orphans.append(rows[i])
+
+                continue
+
+            if j != i:
+                self.misaligned.append((i, _id, 'remapped'))
+
+            self._target[j] = values
+            placed.add(j)
+
+        # stored resume row points into the old layout, new or moved
+        # prompts may now sit anywhere so go back to the first unlabeled one
+        self._resume = self.first_unlabeled()
+
+        # trim back to the last row carrying labels
+        while self._target and self._target[-1] == [-1, -1]:
+            self._target.pop()
+
+        if orphans:
+            # keep labels that match no source prompt instead of dropping
+            # them, merged with the ones left by earlier regenerations
+            orphans_path = self.target.with_name(self.target.name + '.orphans.csv')
+            if orphans_path.is_file():
+                orphans = csv_to_list(orphans_path) + orphans
+
+            list_to_csv(orphans_path, list(dict.fromkeys(orphans)))
+
+    def _source_row_hash(self, index: int) -> bytes:
+        return self._source_hashes[index * _hash_size:(index + 1) * _hash_size]
+
+    def _apply_label_cache(self, label_cache: LabelCache) -> None:
+        # learn from every labeled row already in target
+        label_cache.add(
+            (self._source[i][2], *values)
+            for i, values in enumerate(self._target)
+            if is_labeled(*values)
+        )
+
+        # pre-fill labels for prompts seen in other datasets
+        pending = [
+            i for i in range(self._current_index, len(self._target))
+            if not is_labeled(*self._target[i])
+        ]
+        known = label_cache.lookup(self._source[i][2] for i in pending)
+        for i, labels in zip(pending, known):
+            if labels:
+                self._target[i] = list(labels)
+                self._known.add(i)
+
+    def _skip_known_from(self, index: int) -> int:
+        if self.skip_known:
+            while index in self._known and index < (len(self._source) - 1):
+                index += 1
+
+        return index
+
+    def __len__(self) -> int:
+        return len(self._source)
+
+    def get_values(self) -> list[float, float]:
+        return self._target[self._current_index]
+
+    def get_row(self, index: int) -> tuple[str, str, float, int]:
+        _id, ts, prompt, block_num, block_id, trx_id = self._source[index]
+        return (_id, prompt, *self._target[index])
+
+    def get_prompt(self) -> str:
+        return self._source[self._current_index]
+
+    def set_value(self, index: int, value) -> None:
+        self._target[self._current_index][index] = value
+
+    def set_values(self, rows: list[int], index: int, value) -> None:
+        # bulk label many rows with a single save
+        if not rows:
+            return
+
+        for i in rows:
+            self._target[i][index] = value
+
+        # an MI only bulk label still leaves the prompt to label
+        self._known.update(i for i in rows if is_labeled(*self._target[i]))
+        self._saved_index = max(self._saved_index, max(rows))
+        self.save_target()
+
+    def set_row_values(self, index: int, values: tuple[float, int]) -> None:
+        # label a row without saving, caller is in charge of persisting
+        self._target[index] = list(values)
+        if is_labeled(*values):
+            self._known.add(index)
+        self._saved_index = max(self._saved_index, index)
+
+    def target_rows(self) -> list[tuple[str, str, float, int]]:
+        end = max(self._saved_index, self._current_index) + 1
+        final = []
+        for i, values in enumerate(self._target[:end]):
+            _id, ts, prompt, block_num, block_id, trx_id = self._source[i]
+            final.append((
+                _id, prompt, *values))
+
+        return final
+
+    def first_unlabeled(self) -> int:
+        return next(
+            (i for i, values in enumerate(self._target) if not is_labeled(*values)),
+            max(len(self._target) - 1, 0)
+        )
+
+    def write_target(self, rows: list[tuple[str, str, float, int]], resume: int) -> None:
+        # thread safe, only touches the given rows
+        write_target_file(self.target, rows, resume)
+
+    def save_target(self) -> None:
+        # the prompt on screen is where labeling resumes on next open
+        if not self.telemetry:
+            self.write_target(self.target_rows(), self._current_index)
+            return
+
+        with self.telemetry.measure('save', rows=self._saved_index + 1):
+            self.write_target(self.target_rows(), self._current_index)
+
+    def _leave_current(self) -> None:
+        # rows only visited are not worth persisting once left behind, the
+        # resume row lives in the sidecar, not in the target length
+        if self._target[self._current_index] != [-1, -1]:
+            self._saved_index = max(self._saved_index, self._current_index)
+
+    def prev_prompt(self) -> None:
+        if self._current_index > 0:
+            self._values_changed = False
+            self._leave_current()
+            self._current_index -= 1
+
+        self.save_target()
+
+    def next_prompt(self) -> None:
+        if self._current_index < (len(self._source) - 1):
+            self._values_changed = False
+            self._leave_current()
+            self._current_index = self._skip_known_from(self._current_index + 1)
+
+        self.save_target()
+
+    def goto_prompt(self, index: int) -> None:
+        if 0 <= index < len(self._source):
+            self._values_changed = False
+            self._leave_current()
+            self._current_index = index
+
+        self.save_target()
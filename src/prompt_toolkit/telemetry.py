@@ -0,0 +1,158 @@
+import json
+import time
+import uuid
+
+from typing import Iterable
+from pathlib import Path
+from contextlib import contextmanager
+from collections import defaultdict
+
+from .utils import get_home_path
+
+
+def get_telemetry_path() -> Path:
+    path = get_home_path() / 'telemetry'
+    path.mkdir(exist_ok=True)
+    return path
+
+
+class Telemetry:
+    '''Append only per-session event log, events are buffered in memory and
+    written as json lines every `flush_every` events so recording stays off
+    the hot path of the Tk event loop.
+    '''
+
+    def __init__(self, path: Path|None = None, flush_every: int = 50):
+        self.session = uuid.uuid4().hex[:12]
+        self.path = Path(path) if path else (
+            get_telemetry_path() / f'{time.strftime("%Y%m%d")}.jsonl')
+        self.flush_every = flush_every
+        self._buffer: list[str] = []
+
+    def record(self, event: str, ms: float|None = None, **fields) -> None:
+        entry = {'t': time.time(), 'session': self.session, 'event': event}
+        if ms is not None:
+            entry['ms'] = round(ms, 3)
+
+        entry.update(fields)
+        self._buffer.append(json.dumps(entry, separators=(',', ':')))
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    @contextmanager
+    def measure(self, event: str, **fields):
+        start = time.perf_counter()
+        try:
+            yield
+
+        finally:
+            self.record(event, ms=(time.perf_counter() - start) * 1000, **fields)
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write('\n'.join(self._buffer) + '\n')
+
+        self._buffer.clear()
+
+    def close(self) -> None:
+        self.record('session_end')
+        self.flush()
+
+
+def _percentile(values: list[float], p: float) -> float:
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def session_report(paths: Iterable[Path], slowest: int = 10) -> dict:
+    sessions: dict[str, dict] = defaultdict(
+        lambda: {'start': None, 'end': None, 'labeled': 0})
+    latencies: dict[str, list[float]] = defaultdict(list)
+    labeled: set[tuple[str, int]] = set()
+    slow_ops: list[tuple[float, str, float, str]] = []
+
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+
+                except json.decoder.JSONDecodeError:
+                    # partial line from a crashed session
+                    continue
+
+                session = sessions[entry['session']]
+                t = entry['t']
+                session['start'] = t if session['start'] is None else min(session['start'], t)
+                session['end'] = t if session['end'] is None else max(session['end'], t)
+
+                # a row counts once per session however often it's revisited
+                if entry['event'] == 'labeled':
+                    key = (entry['session'], entry['index'])
+                    if key not in labeled:
+                        labeled.add(key)
+                        session['labeled'] += 1
+
+                if 'ms' in entry:
+                    latencies[entry['event']].append(entry['ms'])
+                    slow_ops.append((entry['ms'], entry['event'], t, entry['session']))
+
+    for session in sessions.values():
+        hours = (session['end'] - session['start']) / 3600
+        session['hours'] = hours
+        session['labels_per_hour'] = session['labeled'] / hours if hours else 0.0
+
+    total_hours = sum(session['hours'] for session in sessions.values())
+    total_labeled = sum(session['labeled'] for session in sessions.values())
+
+    actions = {}
+    for event, values in latencies.items():
+        values.sort()
+        actions[event] = {
+            'count': len(values),
+            'p50': _percentile(values, 0.50),
+            'p90': _percentile(values, 0.90),
+            'p99': _percentile(values, 0.99),
+            'max': values[-1]
+        }
+
+    slow_ops.sort(reverse=True)
+
+    return {
+        'sessions': dict(sessions),
+        'labeled': total_labeled,
+        'hours': total_hours,
+        'labels_per_hour': total_labeled / total_hours if total_hours else 0.0,
+        'actions': actions,
+        'slowest': slow_ops[:slowest]
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f'{len(report["sessions"])} sessions, {report["hours"]:.2f}h, '
+        f'{report["labeled"]} prompts labeled, '
+        f'{report["labels_per_hour"]:.1f} labels/hour',
+        '',
+        'per session:'
+    ]
+    for name, session in sorted(report['sessions'].items(), key=lambda s: s[1]['start']):
+        started = time.strftime('%Y-%m-%d %H:%M', time.localtime(session['start']))
+        lines.append(
+            f'  {name} {started} {session["hours"]:.2f}h '
+            f'{session["labeled"]} labeled {session["labels_per_hour"]:.1f}/h')
+
+    lines += ['', f'{"action":<12}{"count":>8}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}{"max ms":>10}']
+    for event, stats in sorted(report['actions'].items()):
+        lines.append(
+            f'{event:<12}{stats["count"]:>8}{stats["p50"]:>10.1f}'
+            f'{stats["p90"]:>10.1f}{stats["p99"]:>10.1f}{stats["max"]:>10.1f}')
+
+    lines += ['', 'slowest operations:']
+    for ms, event, t, session in report['slowest']:
+        when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))
+        lines.append(f'  {ms:>10.1f}ms {event:<12} {when} {session}')
+
+    return '\n'.join(lines)
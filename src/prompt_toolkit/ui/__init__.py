@@ -1,24 +1,28 @@
 from types import SimpleNamespace
 
 from tkinter import (
-    Tk, Frame, Menu, Label, Text, Button, Scale, Checkbutton,
+    Tk, Toplevel, Frame, Menu, Label, Text, Button, Scale, Checkbutton, Scrollbar,
+    Listbox,
     filedialog, messagebox,
     END, HORIZONTAL, TOP, LEFT, NORMAL,
     TclError
 )
 
 widget_types: dict[str, type] = {
+    'toplevel': Toplevel,
     'frame': Frame,
     'menu': Menu,
     'label': Label,
     'text': Text,
     'button': Button,
     'scale': Scale,
-    'checkbutton': Checkbutton
+    'checkbutton': Checkbutton,
+    'scrollbar': Scrollbar,
+    'listbox': Listbox
 }
 
 widgets_with_text = (Menu, Label, Button, Checkbutton)
-widgets_with_foreground = (Menu, Label, Text, Button, Scale, Checkbutton)
+widgets_with_foreground = (Menu, Label, Text, Button, Scale, Checkbutton, Listbox)
 widgets_with_active = (Menu, Button, Checkbutton)
 widgets_with_indicator = (Checkbutton,)
 
@@ -61,6 +65,13 @@ class TkAppContext:
         self._options = options
         self._resources = resources
 
+        # (widget class, theme items) -> resolved config kwargs
+        self._theme_cache: dict[tuple, dict] = {}
+        # last options applied through `configure` and last (text, center)
+        # pushed through `set_text`, keyed by tk path name
+        self._applied: dict[str, dict] = {}
+        self._text_state: dict[str, tuple[str, bool]] = {}
+
         for wtype, _ in widget_types.items():
             setattr(self, wtype, SimpleNamespace())
 
@@ -78,10 +89,10 @@ class TkAppContext:
         for widget, resource in self._text_resource_list:
             txt = self.get_text(resource)
             if isinstance(widget, Text):
-                _set_text(widget, txt)
+                self.set_text(widget, txt)
 
             else:
-                widget.config(text=txt)
+                self.configure(widget, text=txt)
 
     @property
     def language(self) -> str:
@@ -133,11 +144,48 @@ class TkAppContext:
     def get_label(self, name: str) -> Label:
         return self.get_widget('label', name)
 
-    def set_theme(self, widget, theme: dict|None = None) -> None:
+    def configure(self, widget, **kwargs) -> None:
+        '''Like `widget.config` but only sends options that changed since
+        the last call, in a single round trip. Options set by calling
+        `config` directly on the widget are not tracked.
+        '''
+        applied = self._applied.setdefault(str(widget), {})
+        changed = {
+            key: value
+            for key, value in kwargs.items()
+            if key not in applied or applied[key] != value
+        }
+        if changed:
+            widget.config(**changed)
+            applied.update(changed)
+
+    def set_text(self, widget: Text, text: str, center: bool = True) -> None:
+        '''Replace the contents of a Text widget, skipped when the same text
+        was already pushed to it.
+        '''
+        state = (text, center)
+        if self._text_state.get(str(widget)) == state:
+            return
+
+        _set_text(widget, text, center=center)
+        self._text_state[str(widget)] = state
+
+    def _forget_widget(self, event) -> None:
+        # tk path names get reused, a new widget must not inherit state
+        self._applied.pop(str(event.widget), None)
+        self._text_state.pop(str(event.widget), None)
+
+    def compile_theme(self, widget, theme: dict|None = None) -> dict:
+        wclass = type(widget)
+        key = (wclass, tuple(theme.items()) if theme else None)
+        kwargs = self._theme_cache.get(key)
+        if kwargs is not None:
+            return kwargs
+
         kwargs = {}
-        has_fg = type(widget) in widgets_with_foreground
-        has_active = type(widget) in widgets_with_active
-        has_indicator = type(widget) in widgets_with_indicator
+        has_fg = wclass in widgets_with_foreground
+        has_active = wclass in widgets_with_active
+        has_indicator = wclass in widgets_with_indicator
 
         if not theme:
             theme = {
@@ -162,12 +210,11 @@ class TkAppContext:
 
         kwargs['bg'] = self.get_color(theme['bg'])
 
-        # try:
-        widget.config(**kwargs)
+        self._theme_cache[key] = kwargs
+        return kwargs
 
-        # except TclError as e:
-        #     breakpoint()
-        #     raise e
+    def set_theme(self, widget, theme: dict|None = None) -> None:
+        self.configure(widget, **self.compile_theme(widget, theme=theme))
 
     def init_widget(
         self,
@@ -192,10 +239,12 @@ class TkAppContext:
             init_kwargs['text'] = self.get_text(text_resource)
 
         w = wclass(parent, **init_kwargs)
+        w.bind('<Destroy>', self._forget_widget, add='+')
+        self._applied[str(w)] = dict(init_kwargs)
         self.set_theme(w, theme=theme)
 
         if wclass == Text and text_resource:
-            _set_text(w, self.get_text(text_resource))
+            self.set_text(w, self.get_text(text_resource))
             self._text_resource_list.append((w, text_resource))
 
         setattr(getattr(self, wtype), name, w)
@@ -204,6 +253,9 @@ class TkAppContext:
         if has_text:
             self._text_resource_list.append((w, text_resource))
 
+    def init_toplevel(self, name: str, **kwargs) -> None:
+        self.init_widget('toplevel', name, **kwargs)
+
     def init_frame(self, name: str, **kwargs) -> None:
         self.init_widget('frame', name, **kwargs)
 
@@ -225,9 +277,18 @@ class TkAppContext:
     def init_checkbutton(self, name: str, **kwargs) -> None:
         self.init_widget('checkbutton', name, **kwargs)
 
+    def init_scrollbar(self, name: str, **kwargs) -> None:
+        self.init_widget('scrollbar', name, **kwargs)
+
+    def init_listbox(self, name: str, **kwargs) -> None:
+        self.init_widget('listbox', name, **kwargs)
+
     def pack(self) -> None:
+        # only pack widgets initialized since the last call
         for name, wtype, pargs in self._pack_list:
-            if wtype in ['menu']:
+            if wtype in ['menu', 'toplevel']:
                 continue
 
             self.get_widget(wtype, name).pack(**pargs)
+
+        self._pack_list.clear()
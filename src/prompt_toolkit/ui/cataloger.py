@@ -1,11 +1,18 @@
 import json
+import time
 
 from tkinter import END, DISABLED
 from pathlib import Path
+from contextlib import nullcontext
 from collections import OrderedDict
 
-from . import _set_text, TkAppContext
-from ..utils import get_home_path, csv_to_list, list_to_csv
+from . import TkAppContext
+from .overview import OverviewPane
+from .clusters import ClusterPane
+from ..utils import get_home_path
+from ..storage import PromptStorage
+from ..telemetry import Telemetry
+from ..label_cache import LabelCache, is_labeled
 
 
 def load_settings() -> dict:
@@ -22,59 +29,11 @@ def save_settings(settings: dict) -> None:
         file.write(json.dumps(settings, indent=4))
 
 
-class PromptStorage:
-
-    def __init__(
-        self,
-        source: str,
-        target: str
-    ):
-        self.source = Path(source)
-        self.target = Path(target)
-
-        self._source = csv_to_list(source)
-        self._target = []
-
-        if self.target.is_file():
-            self._target = [
-                [float(nsfw_val), int(mi_val)]
-                for _id, prompt, nsfw_val, mi_val in csv_to_list(target)
-            ]
-
-        self._current_index = len(self._target)
-
-        for i in range(self._current_index, len(self._source)):
-            self._target.append([-1, -1])
-
-    def get_values(self) -> list[float, float]:
-        return self._target[self._current_index]
-
-    def get_prompt(self) -> str:
-        return self._source[self._current_index]
-
-    def set_value(self, index: int, value) -> None:
-        self._target[self._current_index][index] = value
-
-    def save_target(self) -> None:
-        final = []
-        for i, values in enumerate(self._target[:self._current_index + 1]):
-            _id, ts, prompt, block_num, block_id, trx_id = self._source[i]
-            final.append((
-                _id, prompt, *values))
-
-        list_to_csv(self.target, final)
-
-    def prev_prompt(self) -> None:
-        self.save_target()
-        if self._current_index > 0:
-            self._values_changed = False
-            self._current_index -= 1
-
-    def next_prompt(self) -> None:
-        self.save_target()
-        if self._current_index < (len(self._source) - 1):
-            self._values_changed = False
-            self._current_index += 1
+_dataset_ftypes: list[tuple[str, str]] = [
+    ('csv files', '*.csv'),
+    ('compressed csv files', '*.csv.gz *.csv.bz2 *.csv.xz *.csv.zst'),
+    ('all files', '*.*')
+]
 
 
 _nsfw_help = (
@@ -164,6 +123,12 @@ def run_cataloger():
                     'select_target_file': 'Select target file...',
 
                     'source_file_load_error': 'Could not load source dataset!',
+                    'target_misaligned_title': 'Target does not match source',
+                    'target_misaligned': (
+                        '{remapped} labels were moved to their prompt\'s new row and '
+                        '{orphaned} labels match no prompt in the source, those were '
+                        'saved to {orphans}.'
+                    ),
 
                     'prev_prompt': '<',
                     'next_prompt': '>',
@@ -173,7 +138,28 @@ def run_cataloger():
                     'nsfw_help': _nsfw_help,
                     'mi_label': 'Minor Involvment',
                     'mi_help_title': 'MI factor help',
-                    'mi_help': _mi_help
+                    'mi_help': _mi_help,
+
+                    'view_menu': 'View',
+                    'overview_menu': 'Overview',
+                    'overview_title': 'Prompt Cataloger 3000 - Overview',
+                    'overview_col_index': '#',
+                    'overview_col_nsfw': 'NSFW',
+                    'overview_col_mi': 'MI',
+                    'overview_refresh': 'Refresh',
+                    'overview_filter_all': 'All',
+                    'overview_filter_unlabeled': 'Unlabeled',
+                    'overview_filter_labeled': 'Labeled',
+                    'overview_filter_nsfw': 'NSFW',
+                    'overview_filter_mi': 'MI',
+
+                    'clusters_menu': 'Clusters',
+                    'clusters_title': 'Prompt Cataloger 3000 - Clusters',
+                    'clusters_empty': 'No prompt clusters found.',
+                    'clusters_loading': 'Grouping prompts...',
+                    'clusters_apply_nsfw': 'Apply NSFW',
+                    'clusters_mi_yes': 'MI: yes',
+                    'clusters_mi_no': 'MI: no'
                 },
                 'es': {
                     'title': 'Catalogador de Prompts - ACME',
@@ -190,6 +176,12 @@ def run_cataloger():
                     'select_target_file': 'Seleccionar objetivo...',
 
                     'source_file_load_error': 'No se pudo cargar la fuente de datos!',
+                    'target_misaligned_title': 'El objetivo no coincide con la fuente',
+                    'target_misaligned': (
+                        '{remapped} etiquetas se movieron a la nueva fila de su prompt y '
+                        '{orphaned} etiquetas no coinciden con ningun prompt de la fuente, '
+                        'estas se guardaron en {orphans}.'
+                    ),
 
                     'prev_prompt': '<',
                     'next_prompt': '>',
@@ -199,7 +191,28 @@ def run_cataloger():
                     'nsfw_help': _nsfw_help_es,
                     'mi_label': 'Involucra Menores',
                     'mi_help_title': 'Ayuda factor MI',
-                    'mi_help': _mi_help_es
+                    'mi_help': _mi_help_es,
+
+                    'view_menu': 'Ver',
+                    'overview_menu': 'Vista general',
+                    'overview_title': 'Catalogador de Prompts - Vista general',
+                    'overview_col_index': '#',
+                    'overview_col_nsfw': 'NSFW',
+                    'overview_col_mi': 'MI',
+                    'overview_refresh': 'Actualizar',
+                    'overview_filter_all': 'Todos',
+                    'overview_filter_unlabeled': 'Sin etiquetar',
+                    'overview_filter_labeled': 'Etiquetados',
+                    'overview_filter_nsfw': 'NSFW',
+                    'overview_filter_mi': 'MI',
+
+                    'clusters_menu': 'Grupos',
+                    'clusters_title': 'Catalogador de Prompts - Grupos',
+                    'clusters_empty': 'No se encontraron grupos de prompts.',
+                    'clusters_loading': 'Agrupando prompts...',
+                    'clusters_apply_nsfw': 'Aplicar NSFW',
+                    'clusters_mi_yes': 'MI: si',
+                    'clusters_mi_no': 'MI: no'
                 }
             }
         }
@@ -208,7 +221,7 @@ def run_cataloger():
     def select_file(
         initial_dir: str = str(Path()),
         title: str = 'Select file',
-        ftypes: list[tuple[str, str]] = [('csv files', '*.csv'), ('all files', '*.*')],
+        ftypes: list[tuple[str, str]] = _dataset_ftypes,
         error_msg: str = app.get_text('file_not_found'),
     ) -> Path :
         file = None
@@ -227,7 +240,7 @@ def run_cataloger():
     def select_path(
         initial_dir: str = str(Path()),
         title: str = 'Select file',
-        ftypes: list[tuple[str, str]] = [('csv files', '*.csv'), ('all files', '*.*')],
+        ftypes: list[tuple[str, str]] = _dataset_ftypes,
         error_msg: str = app.get_text('file_not_found'),
     ) -> Path:
         file = None
@@ -248,7 +261,7 @@ def run_cataloger():
             title=app.get_text('select_source_file'),
             error_msg=app.get_text('source_file_load_error'))
 
-        app.label.source_path.config(text=file)
+        app.configure(app.label.source_path, text=file)
 
         return file
 
@@ -256,7 +269,7 @@ def run_cataloger():
         file = select_path(
             title=app.get_text('select_target_file'))
 
-        app.label.target_path.config(text=file)
+        app.configure(app.label.target_path, text=file)
 
         return file
 
@@ -347,11 +360,43 @@ def run_cataloger():
     settings['last_target'] = target
     save_settings(settings)
 
-    storage = PromptStorage(source, target)
+    label_cache = None
+    if settings.get('use_label_cache', True):
+        label_cache = LabelCache()
+
+    telemetry = None
+    if settings.get('telemetry', True):
+        telemetry = Telemetry()
+        telemetry.record('session_start', source=source, target=target)
+
+    storage = PromptStorage(
+        source, target,
+        label_cache=label_cache,
+        skip_known=settings.get('skip_known_labels', True),
+        telemetry=telemetry
+    )
+
+    if label_cache is not None:
+        label_cache.close()
+
+    if storage.misaligned:
+        statuses = [status for _, _, status in storage.misaligned]
+        messagebox.showwarning(
+            title=app.get_text('target_misaligned_title'),
+            message=app.get_text('target_misaligned').format(
+                remapped=statuses.count('remapped'),
+                orphaned=statuses.count('orphaned'),
+                orphans=storage.target.name + '.orphans.csv'
+            )
+        )
 
     mi_var = BooleanVar()
     mi_theme = None
 
+    # scale position matching the stored nsfw value, the scale command also
+    # fires (deferred) on programmatic sets and must not write those back
+    shown_nsfw = {'value': 0}
+
     def update_value_display() -> None:
         nsfw_val, mi_val = storage.get_values()
 
@@ -359,6 +404,7 @@ def run_cataloger():
             nsfw_val = 0
 
         display_val = int(nsfw_val * 100)
+        shown_nsfw['value'] = display_val
         app.scale.nsfw_value.set(display_val)
 
         display_val = False
@@ -382,9 +428,30 @@ def run_cataloger():
         mi_var.set(display_val)
         app.set_theme(app.checkbutton.mi_value, theme=mi_theme)
 
+    # perf_counter of last prompt display, its row, whether that row was
+    # already labeled when shown and whether it got label input since
+    prompt_shown = {'at': 0.0, 'index': 0, 'was_labeled': False, 'input': False}
+    # rows that went from unlabeled to labeled during this session
+    session_labeled: set[int] = set()
+
+    def record_labeled() -> None:
+        i = prompt_shown['index']
+        if (
+            telemetry
+            and prompt_shown['input']
+            and not prompt_shown['was_labeled']
+            and i not in session_labeled
+            and is_labeled(*storage.get_row(i)[2:])
+        ):
+            session_labeled.add(i)
+            telemetry.record('labeled', index=i)
+
     def display_prompt() -> None:
-        app.label.source_path.config(text=source)
-        app.label.target_path.config(text=target)
+        start = time.perf_counter()
+        record_labeled()
+
+        app.configure(app.label.source_path, text=source)
+        app.configure(app.label.target_path, text=target)
 
         source_prompt = storage.get_prompt()
 
@@ -392,9 +459,30 @@ def run_cataloger():
 
         update_value_display()
 
-        app.label.prompt_index.config(text=f'{storage._current_index + 1}/{len(storage._source)}')
+        app.configure(app.label.prompt_index, text=f'{storage._current_index + 1}/{len(storage._source)}')
 
-        _set_text(app.text.prompt, prompt)
+        app.set_text(app.text.prompt, prompt)
+
+        if overview.visible:
+            overview.scroll_to_current()
+
+        prompt_shown['at'] = start
+        prompt_shown['index'] = storage._current_index
+        prompt_shown['was_labeled'] = is_labeled(*storage.get_values())
+        prompt_shown['input'] = False
+        if telemetry:
+            # measured once tk is idle again, so redraw time is included
+            index = storage._current_index
+            app.frame.root.after_idle(lambda: telemetry.record(
+                'display', ms=(time.perf_counter() - start) * 1000,
+                index=index))
+
+    def mark_label_input(field: str) -> None:
+        if telemetry and not prompt_shown['input']:
+            prompt_shown['input'] = True
+            telemetry.record(
+                'label', ms=(time.perf_counter() - prompt_shown['at']) * 1000,
+                field=field, index=storage._current_index)
 
     def show_help(topic: str):
         key = topic + '_help'
@@ -402,13 +490,28 @@ def run_cataloger():
             title=app.get_text(key + '_title'),
             message=app.get_text(key))
 
-    def change_prompt(forward: bool = True):
-        if forward:
-            storage.next_prompt()
-        else:
-            storage.prev_prompt()
+    def measure(event: str, **fields):
+        return telemetry.measure(event, **fields) if telemetry else nullcontext()
 
-        display_prompt()
+    def change_prompt(forward: bool = True):
+        with measure(
+            'navigate', direction='next' if forward else 'prev',
+            index=storage._current_index
+        ):
+            if forward:
+                storage.next_prompt()
+            else:
+                storage.prev_prompt()
+
+            display_prompt()
+
+    def select_prompt(index: int):
+        with measure(
+            'navigate', direction='goto',
+            index=storage._current_index
+        ):
+            storage.goto_prompt(index)
+            display_prompt()
 
     def set_language(lang: str):
         settings = load_settings()
@@ -416,6 +519,8 @@ def run_cataloger():
         save_settings(settings)
         app.set_language(lang)
         display_prompt()
+        if clusters.visible:
+            clusters.redraw()
 
     app.init_menu('menu_bar')
     app.init_menu(
@@ -425,6 +530,23 @@ def run_cataloger():
     app.menu.langs.add_command(label='Español', command=lambda: set_language('es'))
 
     app.menu.menu_bar.add_cascade(label='Language/Lenguaje', menu=app.menu.langs)
+
+    overview = OverviewPane(app, storage, select_prompt)
+
+    app.init_menu(
+        'view', init_kwargs={'tearoff': 0}, parent_wtype='menu', parent_name='menu_bar')
+    app.menu.view.add_command(
+        label=app.get_text('overview_menu'), command=overview.show)
+
+    def handle_cluster_change():
+        update_value_display()
+        if overview.visible:
+            overview.redraw()
+
+    clusters = ClusterPane(app, storage, select_prompt, handle_cluster_change)
+    app.menu.view.add_command(
+        label=app.get_text('clusters_menu'), command=clusters.show)
+    app.menu.menu_bar.add_cascade(label=app.get_text('view_menu'), menu=app.menu.view)
     app.frame.root.config(menu=app.menu.menu_bar)
 
     # status display
@@ -472,9 +594,20 @@ def run_cataloger():
 
     # user input
     def _handle_nsfw_user_update(event):
+        if app.scale.nsfw_value.get() == shown_nsfw['value']:
+            return
+
         storage.set_value(0, app.scale.nsfw_value.get() / 100)
         update_value_display()
 
+    def _handle_nsfw_release(event):
+        # clicking the already shown position still labels an unlabeled row
+        if storage.get_values()[0] < 0:
+            storage.set_value(0, app.scale.nsfw_value.get() / 100)
+            update_value_display()
+
+        mark_label_input('nsfw')
+
     app.init_scale(
         'nsfw_value',
         init_kwargs={
@@ -493,6 +626,7 @@ def run_cataloger():
     )
 
     def _handle_mi_user_update():
+        mark_label_input('mi')
         storage.set_value(1, int(mi_var.get()))
         update_value_display()
 
@@ -521,4 +655,19 @@ def run_cataloger():
     app.frame.root.bind('<space>', lambda event: change_prompt())
     # app.frame.root.bind('<Configure>', lambda event: app.label.prompt.config(wraplength=event.width))
 
+    # scale command also fires on programmatic sets, only count real input
+    app.scale.nsfw_value.bind('<ButtonRelease-1>', _handle_nsfw_release)
+    app.scale.nsfw_value.bind('<KeyRelease>', lambda event: mark_label_input('nsfw'))
+
+    def close():
+        # labels of the prompt on screen are only saved when leaving it
+        storage.save_target()
+        if telemetry:
+            record_labeled()
+            telemetry.close()
+
+        app.frame.root.destroy()
+
+    app.frame.root.protocol('WM_DELETE_WINDOW', close)
+
     app.frame.root.mainloop()
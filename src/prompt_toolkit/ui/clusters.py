@@ -0,0 +1,265 @@
+import threading
+
+from typing import Callable
+
+from tkinter import END, DISABLED, EXTENDED, HORIZONTAL, LEFT, RIGHT, TOP, BOTH, Y
+
+from . import TkAppContext
+from ..clusters import load_clusters
+
+
+class ClusterPane:
+    '''Bulk labeling window, shows one prompt cluster at a time with its
+    representative and members, labels get applied to the whole cluster or
+    to the selected members in one batched write.
+    '''
+
+    def __init__(
+        self,
+        app: TkAppContext,
+        storage,
+        on_select: Callable[[int], None],
+        on_change: Callable[[], None],
+        min_size: int = 2,
+        prompt_chars: int = 120
+    ):
+        self.app = app
+        self.storage = storage
+        self.on_select = on_select
+        self.on_change = on_change
+
+        self._min_size = min_size
+        self._prompt_chars = prompt_chars
+
+        self._clusters: list[list[int]]|None = None
+        self._loader: threading.Thread|None = None
+        self._current = 0
+
+        self._visible = False
+        self._init_widgets()
+
+    def _init_widgets(self) -> None:
+        app = self.app
+
+        app.init_toplevel('clusters')
+        app.toplevel.clusters.title(app.get_text('clusters_title'))
+        app.toplevel.clusters.protocol('WM_DELETE_WINDOW', self.hide)
+        app.toplevel.clusters.withdraw()
+
+        for frame in ('clusters_status', 'clusters_representative', 'clusters_members', 'clusters_input'):
+            app.init_frame(
+                frame,
+                parent_wtype='toplevel', parent_name='clusters',
+                pack_kwargs={
+                    'side': TOP, 'fill': BOTH, 'padx': 10, 'pady': 5,
+                    'expand': frame == 'clusters_members'
+                }
+            )
+
+        app.init_button(
+            'clusters_prev', text_resource='prev_prompt',
+            init_kwargs={'font': ('Arial', 18), 'command': lambda: self.change_cluster(-1)},
+            pack_kwargs={'side': LEFT, 'padx': 20},
+            parent_name='clusters_status'
+        )
+        app.init_label(
+            'clusters_index', text_resource='loading',
+            init_kwargs={'font': ('Arial', 18)},
+            pack_kwargs={'side': LEFT, 'fill': 'x', 'expand': True},
+            parent_name='clusters_status'
+        )
+        app.init_button(
+            'clusters_next', text_resource='next_prompt',
+            init_kwargs={'font': ('Arial', 18), 'command': lambda: self.change_cluster(1)},
+            pack_kwargs={'side': RIGHT, 'padx': 20},
+            parent_name='clusters_status'
+        )
+
+        app.init_text(
+            'clusters_representative', text_resource='loading',
+            init_kwargs={'font': ('Arial', 18), 'width': 80, 'height': 4},
+            pack_kwargs={'fill': BOTH, 'expand': True},
+            parent_name='clusters_representative'
+        )
+        app.text.clusters_representative.config(state=DISABLED)
+
+        app.init_scrollbar(
+            'clusters_members',
+            pack_kwargs={'side': RIGHT, 'fill': Y},
+            parent_name='clusters_members'
+        )
+        app.init_listbox(
+            'clusters_members',
+            init_kwargs={
+                'height': 15, 'selectmode': EXTENDED, 'exportselection': False,
+                'yscrollcommand': app.scrollbar.clusters_members.set
+            },
+            pack_kwargs={'side': LEFT, 'fill': BOTH, 'expand': True},
+            parent_name='clusters_members'
+        )
+        app.scrollbar.clusters_members.config(command=app.listbox.clusters_members.yview)
+        app.listbox.clusters_members.bind('<Double-Button-1>', self._handle_double_click)
+
+        app.init_label(
+            'clusters_nsfw', text_resource='nsfw_label',
+            init_kwargs={'font': ('Arial', 14)},
+            pack_kwargs={'side': LEFT},
+            parent_name='clusters_input'
+        )
+        app.init_scale(
+            'clusters_nsfw',
+            init_kwargs={'from_': 0, 'to': 100, 'orient': HORIZONTAL},
+            pack_kwargs={'side': LEFT, 'fill': 'x', 'expand': True},
+            parent_name='clusters_input'
+        )
+        app.init_button(
+            'clusters_apply_nsfw', text_resource='clusters_apply_nsfw',
+            init_kwargs={'command': self._handle_apply_nsfw},
+            pack_kwargs={'side': LEFT, 'padx': 10},
+            parent_name='clusters_input'
+        )
+        app.init_button(
+            'clusters_mi_yes', text_resource='clusters_mi_yes',
+            init_kwargs={'command': lambda: self.apply(1, 1)},
+            pack_kwargs={'side': RIGHT, 'padx': 5},
+            parent_name='clusters_input',
+            theme={
+                'fg': 'lighter', 'bg': 'bad',
+                'active_fg': 'light', 'active_bg': 'bad_dark'
+            }
+        )
+        app.init_button(
+            'clusters_mi_no', text_resource='clusters_mi_no',
+            init_kwargs={'command': lambda: self.apply(1, 0)},
+            pack_kwargs={'side': RIGHT, 'padx': 5},
+            parent_name='clusters_input',
+            theme={
+                'fg': 'lighter', 'bg': 'good',
+                'active_fg': 'light', 'active_bg': 'good_dark'
+            }
+        )
+
+    @property
+    def visible(self) -> bool:
+        return self._visible
+
+    @property
+    def clusters(self) -> list[list[int]]:
+        # empty until the background load finishes
+        return self._clusters or []
+
+    def _load(self) -> None:
+        self._clusters = [
+            cluster
+            for cluster in load_clusters(
+                self.storage.source,
+                [row[2] for row in self.storage._source]
+            )
+            if len(cluster) >= self._min_size
+        ]
+
+    def _poll_loader(self) -> None:
+        if self._loader.is_alive():
+            self.app.frame.root.after(200, self._poll_loader)
+            return
+
+        if self._clusters is None:
+            # loader crashed, leave the window usable as an empty one
+            self._clusters = []
+
+        if self._visible:
+            self.redraw()
+
+    def load(self) -> None:
+        '''Compute (or read cached) clusters on a worker thread, clustering
+        big sources takes seconds and would freeze the Tk event loop.
+        '''
+        if self._loader is not None:
+            return
+
+        self._loader = threading.Thread(target=self._load, daemon=True)
+        self._loader.start()
+        self._poll_loader()
+
+    def show(self) -> None:
+        self._visible = True
+        self.app.toplevel.clusters.deiconify()
+        self.app.toplevel.clusters.lift()
+        self.load()
+        self.redraw()
+
+    def hide(self) -> None:
+        self._visible = False
+        self.app.toplevel.clusters.withdraw()
+
+    def change_cluster(self, step: int) -> None:
+        if self.clusters:
+            self._current = (self._current + step) % len(self.clusters)
+            self.app.listbox.clusters_members.selection_clear(0, END)
+            self.redraw()
+
+    def selected_rows(self) -> list[int]:
+        cluster = self.clusters[self._current]
+        selection = self.app.listbox.clusters_members.curselection()
+        if selection:
+            return [cluster[pos] for pos in selection]
+
+        return cluster
+
+    def apply(self, index: int, value) -> None:
+        if not self.clusters:
+            return
+
+        self.storage.set_values(self.selected_rows(), index, value)
+        self.redraw()
+        self.on_change()
+
+    def _handle_apply_nsfw(self) -> None:
+        self.apply(0, self.app.scale.clusters_nsfw.get() / 100)
+
+    def _handle_double_click(self, event) -> None:
+        selection = self.app.listbox.clusters_members.curselection()
+        if selection and self.clusters:
+            self.on_select(self.clusters[self._current][selection[0]])
+
+    def _format_member(self, i: int) -> str:
+        _id, prompt, nsfw_val, mi_val = self.storage.get_row(i)
+
+        prompt = ' '.join(prompt.split())
+        if len(prompt) > self._prompt_chars:
+            prompt = prompt[:self._prompt_chars - 3] + '...'
+
+        nsfw = f'{int(nsfw_val * 100)}' if nsfw_val >= 0 else '-'
+        mi = str(mi_val) if mi_val >= 0 else '-'
+        return f'{i + 1}  [{nsfw}|{mi}]  {prompt}'
+
+    def redraw(self) -> None:
+        app = self.app
+        members = app.listbox.clusters_members
+
+        if not self.clusters:
+            app.configure(app.label.clusters_index, text='0/0')
+            app.set_text(
+                app.text.clusters_representative,
+                app.get_text('clusters_empty' if self._clusters is not None else 'clusters_loading'))
+            members.delete(0, END)
+            return
+
+        cluster = self.clusters[self._current]
+        app.configure(
+            app.label.clusters_index,
+            text=f'{self._current + 1}/{len(self.clusters)} ({len(cluster)})')
+
+        app.set_text(app.text.clusters_representative, self.storage.get_row(cluster[0])[1])
+
+        # keep selection and scroll position across relabels of same cluster
+        selection = members.curselection()
+        yview = members.yview()
+
+        members.delete(0, END)
+        members.insert(END, *(self._format_member(i) for i in cluster))
+
+        for pos in selection:
+            members.selection_set(pos)
+
+        members.yview_moveto(yview[0])
@@ -0,0 +1,359 @@
+from array import array
+from typing import Callable
+
+from tkinter import LEFT, RIGHT, TOP, BOTH, Y
+
+from . import TkAppContext
+from ..label_cache import is_labeled
+
+
+sort_columns = ('index', 'nsfw', 'mi')
+
+row_filters: dict[str, Callable[[list], bool]] = {
+    'all': lambda values: True,
+    'unlabeled': lambda values: not is_labeled(*values),
+    'labeled': lambda values: is_labeled(*values),
+    'nsfw': lambda values: values[0] >= 0.5,
+    'mi': lambda values: values[1] == 1
+}
+
+
+class OverviewIndex:
+    '''Sorted and filtered views over a PromptStorage, stored as compact
+    arrays of row indexes so huge datasets never get copied around.
+
+    Views are snapshots, they only get rebuilt when the sort or filter
+    changes or `invalidate` is called, row contents are always fetched
+    live from the storage.
+    '''
+
+    def __init__(self, storage):
+        self._storage = storage
+        self._orders: dict[str, array] = {}
+        self._views: dict[tuple[str, bool, str], array] = {}
+        # view key -> position of each storage row in that view, -1 if absent
+        self._positions: dict[tuple[str, bool, str], array] = {}
+
+    def invalidate(self) -> None:
+        self._orders.clear()
+        self._views.clear()
+        self._positions.clear()
+
+    def _order(self, column: str) -> array:
+        order = self._orders.get(column)
+        if order:
+            return order
+
+        target = self._storage._target
+        match column:
+            case 'index':
+                order = array('q', range(len(target)))
+
+            case 'nsfw':
+                order = array('q', sorted(range(len(target)), key=lambda i: target[i][0]))
+
+            case 'mi':
+                order = array('q', sorted(range(len(target)), key=lambda i: target[i][1]))
+
+            case _:
+                raise ValueError(f'Can\'t sort by column {column}')
+
+        self._orders[column] = order
+        return order
+
+    def view(
+        self,
+        column: str = 'index',
+        reverse: bool = False,
+        row_filter: str = 'all'
+    ) -> array:
+        key = (column, reverse, row_filter)
+        view = self._views.get(key)
+        if view is not None:
+            return view
+
+        if row_filter not in row_filters:
+            raise ValueError(f'No row filter named {row_filter}')
+
+        order = self._order(column)
+        if reverse:
+            order = order[::-1]
+
+        if row_filter == 'all':
+            view = order
+
+        else:
+            target = self._storage._target
+            match = row_filters[row_filter]
+            view = array('q', (i for i in order if match(target[i])))
+
+        self._views[key] = view
+        return view
+
+    def positions(
+        self,
+        column: str = 'index',
+        reverse: bool = False,
+        row_filter: str = 'all'
+    ) -> array:
+        '''Inverse of `view`, maps a storage row to its position in the view
+        so locating a row is O(1) instead of a scan over the view.
+        '''
+        key = (column, reverse, row_filter)
+        positions = self._positions.get(key)
+        if positions is not None:
+            return positions
+
+        view = self.view(column=column, reverse=reverse, row_filter=row_filter)
+        positions = array('q', [-1]) * len(self._storage._target)
+        for position, i in enumerate(view):
+            positions[i] = position
+
+        self._positions[key] = positions
+        return positions
+
+
+class OverviewPane:
+    '''Virtualized grid listing storage rows in a separate window.
+
+    Only `rows` row widgets are ever created, scrolling re-points them at
+    different storage rows instead of creating new ones.
+    '''
+
+    def __init__(
+        self,
+        app: TkAppContext,
+        storage,
+        on_select: Callable[[int], None],
+        rows: int = 25,
+        prompt_chars: int = 100
+    ):
+        self.app = app
+        self.storage = storage
+        self.index = OverviewIndex(storage)
+        self.on_select = on_select
+
+        self._rows = rows
+        self._prompt_chars = prompt_chars
+
+        self._sort_column = 'index'
+        self._sort_reverse = False
+        self._row_filter = 'all'
+        self._view = self.index.view()
+        self._positions = self.index.positions()
+        self._top = 0
+
+        self._visible = False
+        self._init_widgets()
+
+    def _init_widgets(self) -> None:
+        app = self.app
+
+        app.init_toplevel('overview')
+        app.toplevel.overview.title(app.get_text('overview_title'))
+        app.toplevel.overview.protocol('WM_DELETE_WINDOW', self.hide)
+        app.toplevel.overview.withdraw()
+
+        app.init_frame(
+            'overview_controls',
+            parent_wtype='toplevel', parent_name='overview',
+            pack_kwargs={'side': TOP, 'fill': 'x', 'padx': 10, 'pady': 5}
+        )
+        for column in sort_columns:
+            app.init_button(
+                f'overview_sort_{column}',
+                text_resource=f'overview_col_{column}',
+                init_kwargs={'command': lambda column=column: self.sort_by(column)},
+                pack_kwargs={'side': LEFT, 'padx': 2},
+                parent_name='overview_controls'
+            )
+
+        app.init_button(
+            'overview_refresh',
+            text_resource='overview_refresh',
+            init_kwargs={'command': self.refresh_index},
+            pack_kwargs={'side': RIGHT, 'padx': 2},
+            parent_name='overview_controls'
+        )
+        for row_filter in reversed(row_filters):
+            app.init_button(
+                f'overview_filter_{row_filter}',
+                text_resource=f'overview_filter_{row_filter}',
+                init_kwargs={'command': lambda row_filter=row_filter: self.filter_by(row_filter)},
+                pack_kwargs={'side': RIGHT, 'padx': 2},
+                parent_name='overview_controls'
+            )
+
+        app.init_frame(
+            'overview_body',
+            parent_wtype='toplevel', parent_name='overview',
+            pack_kwargs={'side': TOP, 'fill': BOTH, 'expand': True, 'padx': 10, 'pady': 5}
+        )
+        app.init_scrollbar(
+            'overview',
+            init_kwargs={'command': self._handle_scrollbar},
+            pack_kwargs={'side': RIGHT, 'fill': Y},
+            parent_name='overview_body'
+        )
+        app.init_frame(
+            'overview_rows',
+            pack_kwargs={'side': LEFT, 'fill': BOTH, 'expand': True},
+            parent_name='overview_body'
+        )
+
+        # fixed row widget pool
+        for r in range(self._rows):
+            app.init_frame(
+                f'overview_row{r}',
+                pack_kwargs={'side': TOP, 'fill': 'x'},
+                parent_name='overview_rows'
+            )
+            for column, width, anchor in (
+                ('index', 8, 'e'),
+                ('prompt', self._prompt_chars, 'w'),
+                ('nsfw', 6, 'e'),
+                ('mi', 4, 'e')
+            ):
+                app.init_label(
+                    f'overview_row{r}_{column}',
+                    init_kwargs={'width': width, 'anchor': anchor},
+                    pack_kwargs={'side': LEFT, 'padx': 2},
+                    parent_name=f'overview_row{r}'
+                )
+                app.get_label(f'overview_row{r}_{column}').bind(
+                    '<Button-1>', lambda event, r=r: self._handle_click(r))
+
+        overview = app.toplevel.overview
+        overview.bind('<MouseWheel>', lambda event: self.scroll(-event.delta // 120))
+        overview.bind('<Button-4>', lambda event: self.scroll(-3))
+        overview.bind('<Button-5>', lambda event: self.scroll(3))
+        overview.bind('<Prior>', lambda event: self.scroll(-self._rows))
+        overview.bind('<Next>', lambda event: self.scroll(self._rows))
+
+    @property
+    def visible(self) -> bool:
+        # tracked locally to avoid a tcl round trip per prompt change
+        return self._visible
+
+    def show(self) -> None:
+        self._visible = True
+        self.app.toplevel.overview.deiconify()
+        self.app.toplevel.overview.lift()
+        self.scroll_to_current()
+
+    def hide(self) -> None:
+        self._visible = False
+        self.app.toplevel.overview.withdraw()
+
+    def sort_by(self, column: str) -> None:
+        if column == self._sort_column:
+            self._sort_reverse = not self._sort_reverse
+
+        else:
+            self._sort_column = column
+            self._sort_reverse = False
+
+        self._update_view()
+
+    def filter_by(self, row_filter: str) -> None:
+        self._row_filter = row_filter
+        self._update_view()
+
+    def refresh_index(self) -> None:
+        self.index.invalidate()
+        self._update_view()
+
+    def _update_view(self) -> None:
+        view_kwargs = {
+            'column': self._sort_column,
+            'reverse': self._sort_reverse,
+            'row_filter': self._row_filter
+        }
+        self._view = self.index.view(**view_kwargs)
+        self._positions = self.index.positions(**view_kwargs)
+        self._top = 0
+        self.redraw()
+
+    def scroll(self, amount: int) -> None:
+        self.scroll_to(self._top + amount)
+
+    def scroll_to(self, top: int) -> None:
+        max_top = max(len(self._view) - self._rows, 0)
+        self._top = min(max(top, 0), max_top)
+        self.redraw()
+
+    def scroll_to_current(self) -> None:
+        position = self._positions[self.storage._current_index]
+        if position < 0:
+            position = self._top
+
+        if not (self._top <= position < self._top + self._rows):
+            position -= self._rows // 2
+
+        else:
+            position = self._top
+
+        self.scroll_to(position)
+
+    def _handle_scrollbar(self, action: str, amount: str, unit: str|None = None) -> None:
+        match action:
+            case 'moveto':
+                self.scroll_to(int(float(amount) * len(self._view)))
+
+            case 'scroll':
+                step = self._rows if unit == 'pages' else 1
+                self.scroll(int(amount) * step)
+
+    def _handle_click(self, r: int) -> None:
+        position = self._top + r
+        if position < len(self._view):
+            self.on_select(self._view[position])
+
+    def redraw(self) -> None:
+        app = self.app
+        total = len(self._view)
+        current = self.storage._current_index
+
+        for r in range(self._rows):
+            position = self._top + r
+            labels = [
+                app.get_label(f'overview_row{r}_{column}')
+                for column in ('index', 'prompt', 'nsfw', 'mi')
+            ]
+
+            if position >= total:
+                for label in labels:
+                    app.configure(label, text='', **app.compile_theme(label))
+
+                continue
+
+            i = self._view[position]
+            _id, prompt, nsfw_val, mi_val = self.storage.get_row(i)
+
+            prompt = ' '.join(prompt.split())
+            if len(prompt) > self._prompt_chars:
+                prompt = prompt[:self._prompt_chars - 3] + '...'
+
+            texts = (
+                str(i + 1),
+                prompt,
+                f'{int(nsfw_val * 100)}' if nsfw_val >= 0 else '-',
+                str(mi_val) if mi_val >= 0 else '-'
+            )
+
+            theme = None
+            if i == current:
+                theme = {
+                    'fg': 'lighter', 'bg': 'darker',
+                    'active_fg': 'light', 'active_bg': 'darker'
+                }
+
+            for label, text in zip(labels, texts):
+                app.configure(label, text=text, **app.compile_theme(label, theme=theme))
+
+        if total:
+            self.app.scrollbar.overview.set(
+                self._top / total, min(self._top + self._rows, total) / total)
+
+        else:
+            self.app.scrollbar.overview.set(0, 1)
@@ -1,10 +1,42 @@
 
+import io
+import os
 import csv
+import bz2
+import gzip
 import json
+import lzma
 
+from typing import Iterator
 from pathlib import Path
 from collections import OrderedDict
 
+try:
+    import zstandard
+
+except ImportError:
+    zstandard = None
+
+
+IO_BUFFER_SIZE = 1024 * 1024
+
+_compression_suffixes: dict[str, str] = {
+    '.gz': 'gzip',
+    '.gzip': 'gzip',
+    '.bz2': 'bz2',
+    '.xz': 'xz',
+    '.lzma': 'xz',
+    '.zst': 'zstd',
+    '.zstd': 'zstd'
+}
+
+_compression_magic: list[tuple[bytes, str]] = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd')
+]
+
 
 def get_home_path() -> Path:
     config_dir = Path.home() / '.ptoolkit'
@@ -12,9 +44,79 @@ def get_home_path() -> Path:
     return config_dir
 
 
+def detect_compression(path: Path, mode: str = 'r') -> str|None:
+    path = Path(path)
+    compression = _compression_suffixes.get(path.suffix.lower())
+    if compression or 'r' not in mode:
+        return compression
+
+    # no known extension, sniff magic bytes on read
+    with open(path, 'rb') as file:
+        head = file.read(8)
+
+    for magic, compression in _compression_magic:
+        if head.startswith(magic):
+            return compression
+
+    return None
+
+
+def _open_zstd(path: Path, mode: str):
+    if not zstandard:
+        raise ImportError(
+            f'Opening {path} requires the zstandard package, '
+            'install with: pip install zstandard')
+
+    if 'r' in mode:
+        return zstandard.ZstdDecompressor().stream_reader(
+            open(path, 'rb'), read_size=IO_BUFFER_SIZE, closefd=True)
+
+    # threads=-1 spawns one compression worker per cpu
+    return zstandard.ZstdCompressor(threads=-1).stream_writer(
+        open(path, 'wb'), write_size=IO_BUFFER_SIZE,
+        write_return_read=True, closefd=True)
+
+
+def open_dataset(
+    path: Path,
+    mode: str = 'r',
+    encoding: str = 'utf-8',
+    newline: str|None = None
+):
+    '''Open a dataset file in text mode, transparently (de)compressing
+    gzip, bz2, xz and zstd streams detected by extension or magic bytes.
+    '''
+    path = Path(path)
+    bmode = mode.replace('t', '').replace('b', '') + 'b'
+
+    match detect_compression(path, mode):
+        case 'gzip':
+            raw = gzip.open(path, bmode, compresslevel=6)
+
+        case 'bz2':
+            raw = bz2.open(path, bmode)
+
+        case 'xz':
+            raw = lzma.open(path, bmode)
+
+        case 'zstd':
+            raw = _open_zstd(path, bmode)
+
+        case _:
+            raw = open(path, bmode, buffering=0)
+
+    if 'r' in mode:
+        buffered = io.BufferedReader(raw, buffer_size=IO_BUFFER_SIZE)
+
+    else:
+        buffered = io.BufferedWriter(raw, buffer_size=IO_BUFFER_SIZE)
+
+    return io.TextIOWrapper(buffered, encoding=encoding, newline=newline)
+
+
 def json_to_csv(source: Path, target: Path):
     # load raw data
-    with open(source, 'r', encoding='utf-8') as file:
+    with open_dataset(source, 'r') as file:
         data = json.load(file)
 
     # filter repeated prompts and non expected formatted prompts
@@ -35,7 +137,7 @@ def json_to_csv(source: Path, target: Path):
             continue
 
     # finally write to csv
-    with open(target, 'w', newline='', encoding='utf-8') as csvfile:
+    with open_dataset(target, 'w', newline='') as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(['ID', 'Timestamp', 'Prompt', 'Block Number', 'Block ID', 'Transaction ID'])
 
@@ -54,18 +156,33 @@ def json_to_csv(source: Path, target: Path):
             writer.writerow([id_str, timestamp, prompt, block_num, block_id, trx_id])
 
 
+def temp_path_for(target: Path) -> Path:
+    # same dir for an atomic rename, same suffix for compression detection
+    target = Path(target)
+    return target.with_name(f'.tmp-{target.name}')
+
+
 def list_to_csv(target: Path, data: list):
-    with open(target, 'w', newline='', encoding='utf-8') as csvfile:
+    # write next to target then rename, a crash mid-write leaves the old file
+    tmp = temp_path_for(target)
+    with open_dataset(tmp, 'w', newline='') as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(['ID', 'Prompt', 'NSFW', 'MI'])
 
         for row in data:
             writer.writerow(row)
 
+    os.replace(tmp, target)
+
+
+def iter_csv(source: Path) -> Iterator[dict[str, str]]:
+    with open_dataset(source, 'r', newline='') as csvfile:
+        yield from csv.DictReader(csvfile)
+
 
 def csv_to_list(source: Path) -> list:
     data = []
-    with open(source, 'r', newline='', encoding='utf-8') as csvfile:
+    with open_dataset(source, 'r', newline='') as csvfile:
         reader = csv.DictReader(csvfile)
         for row in reader:
             data.append(tuple(row[column] for column in reader.fieldnames))
@@ -0,0 +1,152 @@
+import csv
+
+from pathlib import Path
+
+import pytest
+
+from prompt_toolkit.storage import PromptStorage, index_path_for
+from prompt_toolkit.utils import csv_to_list, list_to_csv
+
+
+source_header = ['ID', 'Timestamp', 'Prompt', 'Block Number', 'Block ID', 'Transaction ID']
+
+
+def write_source(path: Path, rows: list[tuple[str, str]]) -> Path:
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(source_header)
+        for _id, prompt in rows:
+            writer.writerow((_id, '2023-12-24T22:37:35.000', prompt, '1', 'block', 'trx'))
+
+    return path
+
+
+def target_labels(path: Path) -> dict[str, tuple[float, int]]:
+    return {
+        prompt: (float(nsfw_val), int(mi_val))
+        for _id, prompt, nsfw_val, mi_val in csv_to_list(path)
+    }
+
+
+@pytest.fixture
+def prompts() -> list[tuple[str, str]]:
+    return [(f'{i:010}', f'prompt number {i}') for i in range(10)]
+
+
+@pytest.fixture
+def labeled(tmp_path, prompts):
+    '''Target with the first 4 prompts labeled, resuming at the 5th.'''
+    source = write_source(tmp_path / 'source.csv', prompts)
+    target = tmp_path / 'target.csv'
+
+    storage = PromptStorage(source, target)
+    for i in range(4):
+        storage.set_value(0, i / 10)
+        storage.set_value(1, i % 2)
+        storage.next_prompt()
+
+    assert storage._current_index == 4
+    return source, target
+
+
+def test_resume_at_saved_row(labeled):
+    source, target = labeled
+    storage = PromptStorage(source, target)
+    assert storage._current_index == 4
+    assert not storage.misaligned
+
+
+def test_resume_after_goto(labeled):
+    source, target = labeled
+    storage = PromptStorage(source, target)
+    storage.goto_prompt(8)
+    storage.goto_prompt(5)
+
+    assert PromptStorage(source, target)._current_index == 5
+
+
+def test_rewritten_target_without_index_resumes_after_it(labeled):
+    source, target = labeled
+    list_to_csv(target, csv_to_list(target)[:2])
+
+    assert PromptStorage(source, target)._current_index == 2
+
+
+def test_reordered_source(tmp_path, labeled, prompts):
+    _, target = labeled
+    source = write_source(tmp_path / 'reordered.csv', prompts[::-1])
+
+    storage = PromptStorage(source, target)
+    assert {reason for _, _, reason in storage.misaligned} == {'remapped'}
+
+    for i, (_id, prompt, nsfw_val, mi_val) in enumerate(map(storage.get_row, range(10))):
+        n = int(prompt.split()[-1])
+        assert (nsfw_val, mi_val) == ((n / 10, n % 2) if n < 4 else (-1, -1))
+
+    # labeled prompts moved to the end, first unlabeled one is now row 0
+    assert storage._current_index == 0
+
+
+def test_inserted_prompt(tmp_path, labeled, prompts):
+    _, target = labeled
+    source = write_source(
+        tmp_path / 'inserted.csv', [('0000000100', 'a brand new prompt'), *prompts])
+
+    storage = PromptStorage(source, target)
+    assert storage.get_row(0)[2:] == (-1, -1)
+    assert storage.get_row(1)[2:] == (0.0, 0)
+    assert storage._current_index == 0
+
+    storage.set_value(0, 0.5)
+    storage.set_value(1, 1)
+    storage.next_prompt()
+    assert storage._current_index == 5
+
+    assert target_labels(target)['a brand new prompt'] == (0.5, 1)
+    assert PromptStorage(source, target)._current_index == 5
+
+
+def test_duplicate_prompts(tmp_path, prompts):
+    dupes = [*prompts[:3], ('0000000050', prompts[1][1]), *prompts[3:]]
+    source = write_source(tmp_path / 'source.csv', dupes)
+    target = tmp_path / 'target.csv'
+
+    storage = PromptStorage(source, target)
+    for i in range(5):
+        storage.set_value(0, i / 10)
+        storage.set_value(1, 0)
+        storage.next_prompt()
+
+    # same prompts, duplicate moved to the end keeps its own labels by ID
+    source = write_source(tmp_path / 'moved.csv', [*prompts, dupes[3]])
+    storage = PromptStorage(source, target)
+    assert storage.get_row(1)[2:] == (0.1, 0)
+    assert storage.get_row(10)[2:] == (0.3, 0)
+    assert not any(reason == 'orphaned' for _, _, reason in storage.misaligned)
+
+    # duplicate dropped from source, its labels end up in the orphans file
+    source = write_source(tmp_path / 'deduped.csv', prompts)
+    storage = PromptStorage(source, target)
+    assert [(_id, reason) for _, _id, reason in storage.misaligned
+            if reason == 'orphaned'] == [('0000000050', 'orphaned')]
+    assert storage.get_row(1)[2:] == (0.1, 0)
+    assert storage._current_index == 4
+
+
+def test_orphans_merged_across_regenerations(tmp_path, labeled, prompts):
+    _, target = labeled
+    orphans = target.with_name(target.name + '.orphans.csv')
+
+    source = write_source(tmp_path / 'first.csv', prompts[1:])
+    PromptStorage(source, target).save_target()
+    assert [row[0] for row in csv_to_list(orphans)] == [prompts[0][0]]
+
+    source = write_source(tmp_path / 'second.csv', prompts[2:])
+    PromptStorage(source, target).save_target()
+    assert [row[0] for row in csv_to_list(orphans)] == [prompts[0][0], prompts[1][0]]
+
+    # same misalignment found again does not duplicate entries
+    index_path_for(target).unlink()
+    list_to_csv(target, csv_to_list(target)[::-1])
+    PromptStorage(source, target)
+    assert len(csv_to_list(orphans)) == 2